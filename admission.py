@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+准入控制模块
+限制同时进行的推理请求数和排队请求数，超出时立即拒绝并给出建议的重试时间，
+避免突发流量把请求无限堆积在内存里、最终所有客户端一起超时
+"""
+
+import math
+import time
+import threading
+
+
+class Rejected(Exception):
+    """请求未被准入"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    有界的推理准入控制
+    同时执行的请求数不超过 max_in_flight，每个类别不超过各自的并发上限；
+    超出的请求最多排队 max_queue 个，排队超过 queue_timeout 秒仍未轮到则拒绝
+    """
+
+    def __init__(self, max_in_flight: int = 4,
+                 max_queue: int = 16,
+                 queue_timeout: float = 30,
+                 category_limit: int = 0,
+                 category_limits: dict = None):
+        """
+        Args:
+            max_in_flight: 全局并发上限
+            max_queue: 最大排队数，0 表示不排队、满了直接拒绝
+            queue_timeout: 最长排队时间（秒）
+            category_limit: 每个类别的默认并发上限，0 表示不限制
+            category_limits: 个别类别的并发上限覆盖 {类别: 并发数}
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.category_limit = category_limit
+        self.category_limits = category_limits or {}
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued = 0
+        self._category_in_flight = {}
+        self._rejected = {}
+        # 请求占用时间的滑动平均（秒），用于估算 Retry-After
+        self._avg_hold = 1.0
+
+    def _limit(self, category: str) -> int:
+        return self.category_limits.get(category, self.category_limit)
+
+    def _can_run(self, category: str) -> bool:
+        if self._in_flight >= self.max_in_flight:
+            return False
+        limit = self._limit(category)
+        return not limit or self._category_in_flight.get(category, 0) < limit
+
+    def _retry_after(self) -> int:
+        """按排队长度和平均处理时间估算多久之后可能有空位"""
+        waves = (self._queued + 1) / max(self.max_in_flight, 1)
+        return max(1, math.ceil(waves * self._avg_hold))
+
+    def _reject(self, reason: str):
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        raise Rejected(reason, self._retry_after())
+
+    def acquire(self, category: str) -> tuple:
+        """
+        申请一个执行名额，必要时排队等待
+        Returns:
+            (类别, 获得名额的时间, 排队耗时)，用于 release
+        Raises:
+            Rejected: 队列已满或排队超时
+        """
+        start = time.monotonic()
+        with self._cond:
+            if not self._can_run(category):
+                if self._queued >= self.max_queue:
+                    self._reject("queue_full")
+
+                self._queued += 1
+                try:
+                    deadline = start + self.queue_timeout
+                    while not self._can_run(category):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject("queue_timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self._queued -= 1
+
+            self._in_flight += 1
+            self._category_in_flight[category] = self._category_in_flight.get(category, 0) + 1
+
+        now = time.monotonic()
+        return category, now, now - start
+
+    def release(self, ticket: tuple):
+        """归还名额并唤醒排队的请求"""
+        category, acquired_at, _ = ticket
+        hold = time.monotonic() - acquired_at
+        with self._cond:
+            self._in_flight -= 1
+            count = self._category_in_flight.get(category, 0) - 1
+            if count > 0:
+                self._category_in_flight[category] = count
+            else:
+                self._category_in_flight.pop(category, None)
+            self._avg_hold = self._avg_hold * 0.9 + hold * 0.1
+            # 类别上限不同，被唤醒的请求未必能执行，全部唤醒后各自重新检查
+            self._cond.notify_all()
+
+    def status(self) -> dict:
+        """当前并发、排队和拒绝统计"""
+        with self._cond:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "category_in_flight": dict(self._category_in_flight),
+                "rejected": dict(self._rejected),
+                "avg_hold_seconds": round(self._avg_hold, 3)
+            }
\ No newline at end of file
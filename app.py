@@ -6,37 +6,314 @@ Flask API wrapper around run_inference() from predict.py
 访问页面: http://localhost:5000/
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
+from werkzeug.security import safe_join
+from werkzeug.exceptions import RequestEntityTooLarge
+from urllib.parse import quote
 from pathlib import Path
 import time
 import logging
+import json
+import base64
+import binascii
+import uuid
+import functools
+import shutil
+import tempfile
+import zipfile
+import tarfile
+import hmac
+import mimetypes
 import os
 
 # 复用你刚才写好的函数
-from predict import run_inference
+from predict import run_inference, run_inference_batch, VIS_FORMATS
+import metrics
+from log_config import setup_logging, request_id_var
+from archive import iter_zip, attachment_headers, ArchiveCache, iter_archive_entries, ArchiveLimitError
+from thumbnails import THUMBNAIL_SIZES, thumbnail_path, get_thumbnail, \
+    remove_category as remove_category_thumbnails, remove_file as remove_file_thumbnails
+from retention import RetentionManager
+from trash import TrashCollector
+from admission import AdmissionController, Rejected
+from coalesce import SingleFlight
+from image_probe import validate_image, probe_image, ImageProbeError
+from records import RECORDS_DIR, append_record, iter_records, record_files
+from export import EXPORT_FORMATS, check_format, iter_export
+from stats import StatsAggregator
+from profiling import RequestProfiler, SamplingProfiler
+from storage import store_upload, collect_orphan_blobs, shard_subdir, iter_files, \
+    new_result_id, is_result_id, result_key, result_sort_key, UsageMonitor
 
 # 配置
 ALLOWED_EXTENSIONS = {"jpg", "jpeg", "png", "bmp", "tiff"}
 SAVE_ROOT = Path("runs/api_test")  # 结果统一放这里
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 MAX_FILES_COUNT = 10  # 最大上传文件数
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(50 * 1000 * 1000)))  # 超过视为解压炸弹
+# 归档上传：请求体大小、文件数、解压后总大小上限，以及每批送入模型的图像数
+ARCHIVE_MAX_BYTES = int(os.environ.get("ARCHIVE_MAX_MB", "1024")) * 1024 * 1024
+ARCHIVE_MAX_ENTRIES = int(os.environ.get("ARCHIVE_MAX_ENTRIES", "5000"))
+ARCHIVE_MAX_TOTAL_BYTES = int(os.environ.get("ARCHIVE_MAX_TOTAL_MB", "4096")) * 1024 * 1024
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "8"))
+ARCHIVE_CONTENT_TYPES = {
+    "application/zip": "zip",
+    "application/x-zip-compressed": "zip",
+    "application/x-tar": "tar",
+    "application/gzip": "tar",
+    "application/x-gzip": "tar",
+    "application/x-gtar": "tar",
+    "application/x-xz": "tar",
+    "application/x-bzip2": "tar"
+}
+MAX_IMAGE_DIMENSION = int(os.environ.get("MAX_IMAGE_DIMENSION", "20000"))  # 单边最大像素
+# 可视化图像编码：格式 (original/jpeg/webp/png)、质量、长边上限 (0 不限制)、检测框线宽 (0 自动)
+VIS_FORMAT = os.environ.get("VIS_FORMAT", "jpeg")
+VIS_QUALITY = int(os.environ.get("VIS_QUALITY", "85"))
+VIS_MAX_DIM = int(os.environ.get("VIS_MAX_DIM", "0"))
+VIS_LINE_WIDTH = int(os.environ.get("VIS_LINE_WIDTH", "0"))
+# 个别类别的覆盖，如 {"food": {"format": "webp", "quality": 80, "max_dim": 1280}}
+VIS_CATEGORY_OPTIONS = json.loads(os.environ.get("VIS_CATEGORY_OPTIONS", "{}"))
+# 性能剖析：未设置管理令牌时剖析功能整体关闭
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+PROFILE_DIR = SAVE_ROOT / ".cache" / "profiles"
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))  # 最多保留的单请求剖析结果数
+PROFILE_SAMPLING = os.environ.get("PROFILE_SAMPLING", "0") == "1"  # 启动时开启采样剖析
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "10")) / 1000
+THUMBNAIL_DIR = SAVE_ROOT / ".cache" / "thumbnails"  # 缩略图缓存
+IMAGE_CACHE_MAX_AGE = 7 * 24 * 3600  # 图像文件名唯一，可以长期缓存
+TRASH_DIR = SAVE_ROOT / ".trash"  # 回收站，清理时目录先移到这里再后台删除
+# 只有上传文件、没有可视化图像的结果在生成后多久内视为仍在推理中，增量同步游标不会越过它（秒）
+CURSOR_PENDING_SECONDS = float(os.environ.get("CURSOR_PENDING_SECONDS", "600"))
+STORAGE_USAGE_TTL = float(os.environ.get("STORAGE_USAGE_TTL", "60"))  # 磁盘占用指标的后台刷新间隔（秒）
+# 类别目录的分片布局: flat / date / hash / date+hash，修改后用 python storage.py migrate 迁移已有文件
+STORAGE_LAYOUT = os.environ.get("STORAGE_LAYOUT", "flat")
+
+# 保留策略，0 表示不限制；类别配额覆盖形如 {"food": 500}，单位 MB
+RETENTION_MAX_AGE_DAYS = float(os.environ.get("RETENTION_MAX_AGE_DAYS", "0"))
+RETENTION_CATEGORY_QUOTA_MB = int(os.environ.get("RETENTION_CATEGORY_QUOTA_MB", "0"))
+RETENTION_CATEGORY_QUOTAS = json.loads(os.environ.get("RETENTION_CATEGORY_QUOTAS", "{}"))
+RETENTION_GLOBAL_QUOTA_MB = int(os.environ.get("RETENTION_GLOBAL_QUOTA_MB", "0"))
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", "300"))  # 秒
+
+# 推理准入控制（每个进程独立计数）；类别并发上限覆盖形如 {"food": 1}，0 表示不限制
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "4"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))  # 秒
+ADMISSION_CATEGORY_LIMIT = int(os.environ.get("ADMISSION_CATEGORY_LIMIT", "0"))
+ADMISSION_CATEGORY_LIMITS = json.loads(os.environ.get("ADMISSION_CATEGORY_LIMITS", "{}"))
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# 前面有 nginx 等反向代理时，可开启 X-Sendfile 由代理直接发送文件
+app.config['USE_X_SENDFILE'] = os.environ.get("USE_X_SENDFILE", "0") == "1"
 CORS(app)  # 启用跨域支持
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()
-    ]
+# 按类别缓存的下载归档，新结果到达时增量追加
+archive_cache = ArchiveCache(SAVE_ROOT / ".cache" / "archives")
+request_profiler = RequestProfiler(PROFILE_DIR, keep=PROFILE_KEEP)
+sampling_profiler = SamplingProfiler(PROFILE_SAMPLE_INTERVAL)
+# 检测记录的增量聚合统计，快照保存在缓存目录，重启后不必重新扫描全部记录
+stats_aggregator = StatsAggregator(SAVE_ROOT, snapshot_path=SAVE_ROOT / ".cache" / "stats.json")
+# 磁盘占用由主进程在后台定期统计，不依赖保留策略是否启用；/metrics 只读取快照
+usage_monitor = UsageMonitor(SAVE_ROOT, SAVE_ROOT / ".cache" / "storage_usage.json", interval=STORAGE_USAGE_TTL)
+
+
+def on_result_evicted(kind: str, category: str, path: Path):
+    """
+    保留策略删除文件后的回调：同步删除缩略图
+    类别归档缓存会在下次下载时发现文件缺失并重建
+    """
+    remove_file_thumbnails(THUMBNAIL_DIR, kind, category,
+                           Path(os.path.relpath(path, SAVE_ROOT / kind / category)).as_posix())
+
+
+def collect_blobs():
+    """上传记录被删除后回收不再被引用的 blob"""
+    collect_orphan_blobs(SAVE_ROOT)
+
+
+# 任务状态保存在 .cache 下，多个工作进程都能查询到其他进程提交的清理任务
+trash_collector = TrashCollector(TRASH_DIR, on_done=collect_blobs, jobs_dir=SAVE_ROOT / ".cache" / "trash_jobs")
+
+retention_manager = RetentionManager(
+    SAVE_ROOT,
+    max_age_days=RETENTION_MAX_AGE_DAYS,
+    category_quota_bytes=RETENTION_CATEGORY_QUOTA_MB * 1024 * 1024,
+    global_quota_bytes=RETENTION_GLOBAL_QUOTA_MB * 1024 * 1024,
+    category_quotas={k: int(v) * 1024 * 1024 for k, v in RETENTION_CATEGORY_QUOTAS.items()},
+    interval=RETENTION_INTERVAL,
+    on_evict=on_result_evicted,
+    on_cycle=collect_blobs
+)
+
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    category_limit=ADMISSION_CATEGORY_LIMIT,
+    category_limits={k: int(v) for k, v in ADMISSION_CATEGORY_LIMITS.items()}
+)
+
+# 合并内容和参数都相同的并发推理请求
+inference_flight = SingleFlight()
+
+# 配置日志：请求线程只入队，由单独的写线程输出 JSON 日志并按大小轮转
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_MAX_MB = int(os.environ.get("LOG_MAX_MB", "50"))
+LOG_BACKUPS = int(os.environ.get("LOG_BACKUPS", "5"))
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))  # INFO 日志采样比例，WARNING 及以上不采样
+
+setup_logging(
+    log_file=LOG_FILE,
+    level=getattr(logging, LOG_LEVEL, logging.INFO),
+    max_bytes=LOG_MAX_MB * 1024 * 1024,
+    backup_count=LOG_BACKUPS,
+    sample_rate=LOG_SAMPLE_RATE
 )
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("app.access")
+
+# 服务指标，通过 /metrics 以 Prometheus 文本格式导出
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP 请求数", ["method", "route", "status"])
+HTTP_ERRORS = metrics.counter(
+    "http_request_errors_total", "HTTP 5xx 响应数", ["route"])
+HTTP_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "HTTP 请求处理耗时（秒）", ["route"])
+HTTP_IN_FLIGHT = metrics.gauge(
+    "http_requests_in_flight", "正在处理的 HTTP 请求数")
+UPLOAD_BYTES = metrics.counter(
+    "upload_bytes_total", "接收的上传文件字节数")
+WRITTEN_BYTES = metrics.counter(
+    "storage_written_bytes_total", "写入磁盘的结果字节数", ["kind"])
+CACHE_REQUESTS = metrics.counter(
+    "cache_requests_total", "缓存访问次数", ["cache", "result"])
+STORAGE_USAGE = metrics.gauge(
+    "storage_usage_bytes", "各类别占用的磁盘空间", ["category"],
+    function=usage_monitor.usage)
+ADMISSION_IN_FLIGHT = metrics.gauge(
+    "admission_in_flight", "正在执行的推理请求数",
+    function=lambda: admission.status()["in_flight"])
+ADMISSION_QUEUED = metrics.gauge(
+    "admission_queue_depth", "等待准入的推理请求数",
+    function=lambda: admission.status()["queued"])
+ADMISSION_REJECTIONS = metrics.counter(
+    "admission_rejections_total", "因繁忙被拒绝的推理请求数", ["reason"])
+ADMISSION_WAIT = metrics.histogram(
+    "admission_wait_seconds", "推理请求的排队耗时（秒）")
+INFERENCE_COALESCED = metrics.counter(
+    "inference_coalesced_total", "复用并发相同请求结果、未单独推理的次数")
+
+
+@app.before_request
+def start_request_timer():
+    """记录请求开始时间，分配请求ID（优先使用上游传入的 X-Request-ID）"""
+    g.start_time = time.perf_counter()
+    g.request_id = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex
+    request_id_var.set(g.request_id)
+    HTTP_IN_FLIGHT.inc()
+
+
+def is_admin() -> bool:
+    """请求是否携带正确的管理令牌；只接受 X-Admin-Token 头，令牌不放在 URL 中以免写入访问日志和代理日志"""
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(PROFILE_ADMIN_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+def admin_required(view):
+    """管理接口：未配置令牌时不存在 (404)，令牌错误时 403"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not PROFILE_ADMIN_TOKEN:
+            return make_response(False, "管理接口未启用，请设置 PROFILE_ADMIN_TOKEN", code=404)
+        if not is_admin():
+            return make_response(False, "管理令牌无效", code=403)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.before_request
+def start_profiling():
+    """
+    采样剖析开启时登记当前线程；
+    请求带 X-Profile: 1 或 ?profile=1 且携带管理令牌时，用 cProfile 剖析整个请求
+    """
+    if sampling_profiler.running:
+        sampling_profiler.track()
+        g.sampling_tracked = True
+
+    if request.headers.get("X-Profile") != "1" and request.args.get("profile") != "1":
+        return
+    if not is_admin():
+        g.profile_status = "unauthorized"
+        return
+    g.profile = request_profiler.start()
+    g.profile_status = "started" if g.profile is not None else "busy"
+
+
+@app.after_request
+def finish_profiling(response):
+    """保存单请求剖析结果，结果ID通过 X-Profile-ID 头返回"""
+    profile = g.pop("profile", None)
+    if profile is not None:
+        duration = time.perf_counter() - g.start_time if "start_time" in g else 0
+        # 请求ID可能来自客户端，用作文件名前先清理
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}_{secure_filename(g.request_id) or uuid.uuid4().hex}"
+        try:
+            request_profiler.stop(profile, profile_id, {
+                "method": request.method,
+                "path": request.path,
+                "route": request.url_rule.rule if request.url_rule is not None else None,
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "pid": os.getpid()
+            })
+            response.headers["X-Profile-ID"] = profile_id
+            g.profile_status = "saved"
+        except OSError as e:
+            logger.error("保存剖析结果失败: %s", e)
+            g.profile_status = "error"
+    if "profile_status" in g:
+        response.headers["X-Profile"] = g.profile_status
+    return response
+
+
+@app.after_request
+def record_request_metrics(response):
+    """按路由模板记录请求数、错误数和耗时（路由模板数量固定，不会造成标签膨胀）"""
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_REQUESTS.inc(request.method, route, response.status_code)
+    if response.status_code >= 500:
+        HTTP_ERRORS.inc(route)
+    duration = time.perf_counter() - g.start_time if "start_time" in g else 0
+    HTTP_LATENCY.observe(route, value=duration)
+    if "request_id" in g:
+        response.headers["X-Request-ID"] = g.request_id
+    access_logger.info("%s %s %s", request.method, request.path, response.status_code, extra={
+        "method": request.method,
+        "path": request.path,
+        "route": route,
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 2)
+    })
+    return response
+
+
+@app.teardown_request
+def finish_request(exc):
+    HTTP_IN_FLIGHT.dec()
+    request_id_var.set(None)
+    # 请求异常中断、after_request 没有执行时也要停止剖析
+    profile = g.pop("profile", None)
+    if profile is not None:
+        request_profiler.stop(profile)
+    if g.pop("sampling_tracked", False):
+        sampling_profiler.untrack()
 
 
 def make_response(ok: bool, msg: str, data=None, code=200):
@@ -54,14 +331,267 @@ def is_valid_extension(filename: str) -> bool:
     return "." in filename and filename.rsplit(".", 1)[-1].lower() in ALLOWED_EXTENSIONS
 
 
-def check_file_content(file_path: Path) -> bool:
-    """简单检查文件内容是否为图像文件"""
+def relative_path(kind: str, category: str, path) -> str:
+    """文件相对于类别目录的路径（包含分片子目录）"""
+    return Path(os.path.relpath(path, SAVE_ROOT / kind / category)).as_posix()
+
+
+def image_url(kind: str, category: str, path) -> str:
+    """生成图像访问地址，kind 为 uploads 或 visualizations"""
+    return f"/results/image/{kind}/{quote(category)}/{quote(relative_path(kind, category, path))}"
+
+
+def result_dirs(category: str, filename: str):
+    """按存储布局计算上传文件和可视化文件所在的分片目录，两者使用同一分片"""
+    subdir = shard_subdir(STORAGE_LAYOUT, filename)
+    return SAVE_ROOT / "uploads" / category / subdir, SAVE_ROOT / "visualizations" / category / subdir
+
+
+def save_upload(data: bytes, file_path: Path) -> dict:
+    """
+    按内容寻址保存上传文件
+    file_path 是指向 blob 的硬链接，内容重复时不会再写一份数据
+    """
+    stored = store_upload(SAVE_ROOT, data, file_path)
+
+    UPLOAD_BYTES.inc(amount=len(data))
+    CACHE_REQUESTS.inc("blob", "hit" if stored["deduplicated"] else "miss")
+    if not stored["deduplicated"]:
+        WRITTEN_BYTES.inc("uploads", amount=len(data))
+    return stored
+
+
+def record_vis_written(result: dict):
+    """统计可视化文件写入的字节数（复用的可视化文件是硬链接，不计入）"""
+    if result.get("vis_path") and not result.get("coalesced"):
+        try:
+            WRITTEN_BYTES.inc("visualizations", amount=Path(result["vis_path"]).stat().st_size)
+        except FileNotFoundError:
+            pass
+
+
+def record_detections(category: str, result: dict, upload_bytes: int = None):
+    """成功的推理结果追加到检测记录，写入失败只记日志，不影响接口返回"""
+    if not result.get("success"):
+        return
+    try:
+        append_record(SAVE_ROOT, category, result, upload_bytes)
+    except OSError as e:
+        logger.warning("写入检测记录失败: %s: %s", result.get("result_id"), e)
+
+
+def coalesced_inference(file_path: Path, vis_dir: Path, result_id: str, digest: str,
+                        image_data: bytes = None, **params) -> dict:
+    """
+    执行推理，内容哈希和推理参数都相同的并发请求只推理一次
+    复用结果的请求会得到自己的结果ID，可视化文件以硬链接的方式复用
+    """
+    key = (digest, tuple(sorted(params.items())))
+    result, shared = inference_flight.do(
+        key, lambda: run_inference(file_path, save_dir=vis_dir, result_id=result_id,
+                                   image_data=image_data, **params))
+    if not shared:
+        # 返回副本，调用方修改结果时不影响正在复制它的等待者
+        return dict(result)
+
+    INFERENCE_COALESCED.inc()
+    vis_image = result.get("vis_image")
+    result = json.loads(json.dumps({k: v for k, v in result.items() if k != "vis_image"}))
+    if vis_image is not None:
+        result["vis_image"] = vis_image
+    result.update({
+        "result_id": result_id,
+        "image": file_path.name,
+        "image_path": str(file_path),
+        "coalesced": True
+    })
+
+    if result.get("vis_path"):
+        source = Path(result["vis_path"])
+        vis_path = vis_dir / f"vis_{result_id}{source.suffix}"
+        try:
+            vis_dir.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(source, vis_path)
+            except OSError:
+                shutil.copyfile(source, vis_path)
+            result["vis_path"] = str(vis_path)
+        except OSError as e:
+            logger.warning("复用可视化图像失败: %s: %s", source, e)
+            result["vis_path"] = None
+
+    logger.info("合并相同的并发推理请求: %s", file_path.name)
+    return result
+
+
+def admitted(view):
+    """
+    推理接口的准入控制，在读取请求体之前申请名额
+    繁忙时直接返回 429 和 Retry-After，上传内容不会被读入内存
+    """
+    @functools.wraps(view)
+    def wrapper(category, *args, **kwargs):
+        try:
+            ticket = admission.acquire(category)
+        except Rejected as e:
+            ADMISSION_REJECTIONS.inc(e.reason)
+            logger.warning("推理请求被拒绝: 类别=%s, 原因=%s", category, e.reason)
+            response, code = make_response(False, "服务繁忙，请稍后重试",
+                                           {"reason": e.reason, "retry_after": e.retry_after}, code=429)
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, code
+
+        ADMISSION_WAIT.observe(value=ticket[2])
+        try:
+            return view(category, *args, **kwargs)
+        finally:
+            admission.release(ticket)
+
+    return wrapper
+
+
+def check_file_content(data: bytes, filename: str) -> dict:
+    """
+    只读取文件头检查图像格式和尺寸，不解码像素；完整解码只在推理时进行一次
+    Raises:
+        ImageProbeError: 不是有效图像、扩展名与内容不符或尺寸超过限制
+    """
+    return validate_image(data, filename, MAX_IMAGE_PIXELS, MAX_IMAGE_DIMENSION)
+
+
+def vis_options(category: str) -> dict:
+    """
+    可视化图像编码选项，优先级: 请求参数 (?vis_format= 等) > 类别配置 > 全局默认
+    Returns:
+        run_inference 的 vis_* 参数
+    Raises:
+        ValueError: 参数无效
+    """
+    options = {"format": VIS_FORMAT, "quality": VIS_QUALITY, "max_dim": VIS_MAX_DIM, "line_width": VIS_LINE_WIDTH}
+    overrides = VIS_CATEGORY_OPTIONS.get(category, {})
+    for key in options:
+        options[key] = request.args.get(f"vis_{key}", overrides.get(key, options[key]))
+
+    if options["format"] not in VIS_FORMATS:
+        raise ValueError(f"不支持的可视化格式: {options['format']}，支持: {', '.join(VIS_FORMATS)}")
     try:
-        import cv2
-        img = cv2.imread(str(file_path))
-        return img is not None
-    except Exception:
-        return False
+        for key in ("quality", "max_dim", "line_width"):
+            options[key] = int(options[key])
+    except (TypeError, ValueError):
+        raise ValueError(f"可视化参数 vis_{key} 应为整数")
+    if not 1 <= options["quality"] <= 100:
+        raise ValueError("可视化参数 vis_quality 应在 1-100 之间")
+    if options["max_dim"] < 0 or options["line_width"] < 0:
+        raise ValueError("可视化参数 vis_max_dim 和 vis_line_width 不能为负数")
+
+    return {f"vis_{key}": value for key, value in options.items()}
+
+
+def process_upload(category: str, data: bytes, original_filename: str,
+                   save_vis: bool = True, return_vis: bool = False, vis: dict = None) -> dict:
+    """
+    校验、保存一张上传图像并执行推理，各上传接口共用
+    图像内容直接交给推理流程解码，不再从磁盘读回
+    Args:
+        save_vis: 是否保存可视化图像
+        return_vis: 是否在结果的 vis_image 字段中返回可视化图像内容
+        vis: 可视化图像编码选项，见 vis_options
+    Raises:
+        ImageProbeError: 图像校验失败
+    """
+    # 检查文件内容，通过后再写盘
+    check_file_content(data, original_filename)
+
+    # 保存文件
+    filename = secure_filename(original_filename)
+    result_id = new_result_id()
+    unique_filename = f"{result_id}_{filename}"
+
+    upload_dir, vis_dir = result_dirs(category, unique_filename)
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    file_path = upload_dir / unique_filename
+
+    stored = save_upload(data, file_path)
+    logger.info("文件保存成功: %s", file_path)
+
+    # 执行推理
+    result = coalesced_inference(file_path, vis_dir, result_id, stored["content_hash"], image_data=data,
+                                 save_vis=save_vis, return_vis=return_vis, **(vis or {}))
+
+    # 添加额外信息
+    result.update({
+        "id": f"{category}_{result_id}",
+        "category": category,
+        "original_filename": filename,
+        "upload_path": str(file_path),
+        "upload_url": image_url("uploads", category, file_path),
+        "content_hash": stored["content_hash"],
+        "deduplicated": stored["deduplicated"],
+        "vis_url": image_url("visualizations", category, result["vis_path"])
+        if result.get("vis_path") else None,
+        "inference_time": time.strftime('%Y-%m-%d %H:%M:%S')
+    })
+
+    record_vis_written(result)
+    record_detections(category, result, len(data))
+    return result
+
+
+# ?response= 支持的返回方式：json 为默认的 JSON 结果；
+# image 直接返回可视化图像，检测摘要放在 X-Detections 头；multipart 同时返回 JSON 和图像
+RESPONSE_MODES = ("json", "image", "multipart")
+# X-Detections 头中包含的字段：只有检测数和置信度最高的检测框，头部大小与检测数无关；
+# 完整的检测列表请用 multipart 或 json
+INLINE_HEADER_FIELDS = ("id", "result_id", "detection_count", "best_detection")
+
+
+def response_options():
+    """
+    解析返回方式
+    Returns:
+        (返回方式, 是否保存可视化图像)；直接返回图像时默认不写盘，?persist=1 时才保存
+    Raises:
+        ValueError: 返回方式无效
+    """
+    mode = request.args.get("response", "json")
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"不支持的返回方式: {mode}，支持: {', '.join(RESPONSE_MODES)}")
+    persist = request.args.get("persist")
+    save_vis = mode == "json" if persist is None else persist.lower() in ("1", "true", "yes")
+    return mode, save_vis
+
+
+def upload_response(result: dict, mode: str):
+    """按返回方式构建单张图像的推理响应"""
+    if mode == "json":
+        return make_response(True, "推理完成", result)
+
+    vis_image = result.pop("vis_image", None)
+    if not result.get("success") or vis_image is None:
+        return make_response(False, f"推理失败: {result.get('error') or '生成可视化图像失败'}", result, code=500)
+
+    suffix = f".{result['vis_format']}"
+    mimetype = mimetypes.guess_type(f"vis{suffix}")[0] or "application/octet-stream"
+    disposition = f'inline; filename="vis_{result["result_id"]}{suffix}"'
+
+    if mode == "image":
+        # 头部只能是 ASCII，json.dumps 默认会转义非 ASCII 字符
+        summary = json.dumps({field: result.get(field) for field in INLINE_HEADER_FIELDS}, separators=(",", ":"))
+        return Response(vis_image, mimetype=mimetype, headers={
+            "Content-Disposition": disposition,
+            "X-Result-ID": result["result_id"],
+            "X-Detections": summary
+        })
+
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json; charset=utf-8\r\n\r\n".encode(),
+        json.dumps(result, ensure_ascii=False).encode("utf-8"),
+        f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Disposition: {disposition}\r\n\r\n".encode(),
+        vis_image,
+        f"\r\n--{boundary}--\r\n".encode()
+    ])
+    return Response(body, content_type=f"multipart/mixed; boundary={boundary}")
 
 
 @app.route("/")
@@ -82,21 +612,31 @@ def healthcheck():
             "server_status": "running",
             "model_status": model_status,
             "save_directory": str(SAVE_ROOT),
+            "storage_layout": STORAGE_LAYOUT,
             "allowed_extensions": list(ALLOWED_EXTENSIONS),
-            "max_file_size_mb": MAX_FILE_SIZE // (1024 * 1024)
+            "max_file_size_mb": MAX_FILE_SIZE // (1024 * 1024),
+            "max_image_pixels": MAX_IMAGE_PIXELS,
+            "visualization": {"format": VIS_FORMAT, "quality": VIS_QUALITY, "max_dim": VIS_MAX_DIM,
+                              "line_width": VIS_LINE_WIDTH, "category_options": VIS_CATEGORY_OPTIONS},
+            "admission": admission.status()
         }
 
         logger.info("健康检查请求成功")
         return make_response(True, "服务器运行正常", data)
 
     except Exception as e:
-        logger.error(f"健康检查失败: {str(e)}")
+        logger.error("健康检查失败: %s", e)
         return make_response(False, f"服务器异常: {str(e)}", code=500)
 
 
 @app.route("/upload/<category>/single", methods=["POST"])
+@admitted
 def upload_single(category):
-    """单文件上传推理接口"""
+    """
+    单文件上传推理接口
+    ?response=image 直接返回可视化图像，?response=multipart 同时返回 JSON 和图像；
+    这两种方式默认不保存可视化图像，需要保存时加 ?persist=1
+    """
     try:
         # 检查文件是否存在
         if "file" not in request.files:
@@ -109,44 +649,28 @@ def upload_single(category):
         if not is_valid_extension(file.filename):
             return make_response(False, f"不支持的文件类型，支持的格式: {', '.join(ALLOWED_EXTENSIONS)}", code=415)
 
-        # 保存文件
-        filename = secure_filename(file.filename)
-        timestamp = int(time.time())
-        unique_filename = f"{timestamp}_{filename}"
-
-        upload_dir = SAVE_ROOT / "uploads" / category
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        file_path = upload_dir / unique_filename
-
-        file.save(file_path)
-        logger.info(f"文件保存成功: {file_path}")
-
-        # 检查文件内容
-        if not check_file_content(file_path):
-            file_path.unlink()  # 删除无效文件
-            return make_response(False, "文件损坏或不是有效的图像文件", code=400)
-
-        # 执行推理
-        vis_dir = SAVE_ROOT / "visualizations" / category
-        result = run_inference(file_path, save_dir=vis_dir)
-
-        # 添加额外信息
-        result.update({
-            "category": category,
-            "original_filename": filename,
-            "upload_path": str(file_path),
-            "inference_time": time.strftime('%Y-%m-%d %H:%M:%S')
-        })
+        try:
+            mode, save_vis = response_options()
+            vis = vis_options(category)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
 
-        logger.info(f"推理完成: {filename}, 类别ID: {result.get('class_id')}")
-        return make_response(True, "推理完成", result)
+        try:
+            result = process_upload(category, file.read(), file.filename,
+                                    save_vis=save_vis, return_vis=mode != "json", vis=vis)
+        except ImageProbeError as e:
+            return make_response(False, str(e), code=400)
+
+        logger.info("推理完成: %s, 类别ID: %s", result["original_filename"], result.get('class_id'))
+        return upload_response(result, mode)
 
     except Exception as e:
-        logger.error(f"单文件上传推理失败: {str(e)}")
+        logger.error("单文件上传推理失败: %s", e)
         return make_response(False, f"推理失败: {str(e)}", code=500)
 
 
 @app.route("/upload/<category>/multiple", methods=["POST"])
+@admitted
 def upload_multiple(category):
     """多文件上传推理接口"""
     try:
@@ -157,6 +681,11 @@ def upload_multiple(category):
         if len(files) > MAX_FILES_COUNT:
             return make_response(False, f"文件数量超过限制，最大支持 {MAX_FILES_COUNT} 个文件", code=400)
 
+        try:
+            vis = vis_options(category)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
+
         results = []
         success_count = 0
 
@@ -177,32 +706,7 @@ def upload_multiple(category):
                 if not is_valid_extension(file.filename):
                     raise ValueError(f"不支持的文件类型")
 
-                # 保存文件
-                filename = secure_filename(file.filename)
-                timestamp = int(time.time())
-                unique_filename = f"{timestamp}_{i + 1}_{filename}"
-
-                upload_dir = SAVE_ROOT / "uploads" / category
-                upload_dir.mkdir(parents=True, exist_ok=True)
-                file_path = upload_dir / unique_filename
-
-                file.save(file_path)
-
-                # 检查文件内容
-                if not check_file_content(file_path):
-                    file_path.unlink()
-                    raise ValueError("文件损坏或不是有效的图像文件")
-
-                # 执行推理
-                vis_dir = SAVE_ROOT / "visualizations" / category
-                inference_result = run_inference(file_path, save_dir=vis_dir)
-
-                # 添加额外信息
-                inference_result.update({
-                    "category": category,
-                    "original_filename": filename,
-                    "upload_path": str(file_path)
-                })
+                inference_result = process_upload(category, file.read(), file.filename, vis=vis)
 
                 file_result.update({
                     "ok": True,
@@ -213,7 +717,7 @@ def upload_multiple(category):
 
             except Exception as e:
                 file_result["msg"] = str(e)
-                logger.error(f"文件 {file.filename} 处理失败: {str(e)}")
+                logger.error("文件 %s 处理失败: %s", file.filename, e)
 
             results.append(file_result)
 
@@ -224,14 +728,294 @@ def upload_multiple(category):
             "results": results
         }
 
-        logger.info(f"批量推理完成: {success_count}/{len(files)} 成功")
+        logger.info("批量推理完成: %s/%s 成功", success_count, len(files))
         return make_response(True, f"批量推理完成，成功 {success_count}/{len(files)} 个文件", summary)
 
     except Exception as e:
-        logger.error(f"批量推理失败: {str(e)}")
+        logger.error("批量推理失败: %s", e)
         return make_response(False, f"批量推理失败: {str(e)}", code=500)
 
 
+# 原始请求体上传时 Content-Type 对应的默认扩展名
+RAW_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/jpg": "jpg",
+    "image/png": "png",
+    "image/bmp": "bmp",
+    "image/x-ms-bmp": "bmp",
+    "image/tiff": "tiff"
+}
+
+
+@app.route("/upload/<category>/raw", methods=["POST"])
+@admitted
+def upload_raw(category):
+    """
+    原始请求体上传推理接口
+    请求体就是图像内容（Content-Type: image/jpeg 等），不经过 multipart 解析；
+    文件名可通过 ?filename= 或 X-Filename 头指定，返回格式与单文件上传接口相同
+    """
+    try:
+        extension = RAW_CONTENT_TYPES.get(request.mimetype)
+        if extension is None:
+            return make_response(False, f"不支持的 Content-Type: {request.mimetype or '未指定'}，"
+                                        f"支持: {', '.join(sorted(RAW_CONTENT_TYPES))}", code=415)
+
+        filename = request.args.get("filename") or request.headers.get("X-Filename") or f"image.{extension}"
+        if not is_valid_extension(filename):
+            return make_response(False, f"不支持的文件类型，支持的格式: {', '.join(ALLOWED_EXTENSIONS)}", code=415)
+
+        try:
+            mode, save_vis = response_options()
+            vis = vis_options(category)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
+
+        data = request.get_data(cache=False)
+        if not data:
+            return make_response(False, "请求体为空", code=400)
+
+        try:
+            result = process_upload(category, data, filename, save_vis=save_vis, return_vis=mode != "json",
+                                    vis=vis)
+        except ImageProbeError as e:
+            return make_response(False, str(e), code=400)
+
+        logger.info("推理完成: %s, 类别ID: %s", result["original_filename"], result.get('class_id'))
+        return upload_response(result, mode)
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error("原始请求体上传推理失败: %s", e)
+        return make_response(False, f"推理失败: {str(e)}", code=500)
+
+
+@app.route("/upload/<category>/base64", methods=["POST"])
+@admitted
+def upload_base64(category):
+    """
+    Base64 JSON 上传推理接口
+    请求体: {"image": "<base64 或 data URI>", "filename": "a.jpg"}，返回格式与单文件上传接口相同
+    """
+    try:
+        try:
+            mode, save_vis = response_options()
+            vis = vis_options(category)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
+
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not body.get("image"):
+            return make_response(False, "请求体应为 JSON，并包含 image 字段", code=400)
+
+        encoded = body["image"]
+        filename = body.get("filename")
+        if not isinstance(encoded, str):
+            return make_response(False, "image 字段应为 Base64 字符串", code=400)
+        if filename is not None and not isinstance(filename, str):
+            return make_response(False, "filename 字段应为字符串", code=400)
+        # data URI: data:image/png;base64,....
+        if encoded.startswith("data:"):
+            header, _, encoded = encoded.partition(",")
+            if not filename:
+                extension = RAW_CONTENT_TYPES.get(header[5:].split(";", 1)[0])
+                filename = f"image.{extension}" if extension else None
+
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, ValueError):
+            return make_response(False, "image 字段不是有效的 Base64 编码", code=400)
+
+        if not filename:
+            # 没有文件名时按内容识别格式
+            try:
+                filename = f"image.{probe_image(data)['format']}"
+            except ImageProbeError as e:
+                return make_response(False, str(e), code=400)
+        if not is_valid_extension(filename):
+            return make_response(False, f"不支持的文件类型，支持的格式: {', '.join(ALLOWED_EXTENSIONS)}", code=415)
+
+        try:
+            result = process_upload(category, data, filename, save_vis=save_vis, return_vis=mode != "json",
+                                    vis=vis)
+        except ImageProbeError as e:
+            return make_response(False, str(e), code=400)
+
+        logger.info("推理完成: %s, 类别ID: %s", result["original_filename"], result.get('class_id'))
+        return upload_response(result, mode)
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error("Base64 上传推理失败: %s", e)
+        return make_response(False, f"推理失败: {str(e)}", code=500)
+
+
+def open_upload_archive():
+    """
+    取得上传的归档和格式
+    支持 multipart 的 archive 字段，或直接以归档作为请求体（按 Content-Type 或 ?format= 判断格式）；
+    TAR 直接从请求流读取，ZIP 需要随机访问，先转存到临时文件
+    Returns:
+        (文件对象, 格式)，文件对象由调用方关闭
+    """
+    fmt = request.args.get("format")
+
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("archive")
+        if upload is None or upload.filename == "":
+            raise ValueError("请求中未包含归档文件（字段名 archive）")
+        if not fmt:
+            fmt = "zip" if upload.filename.lower().endswith(".zip") else "tar"
+        return upload.stream, fmt
+
+    fmt = fmt or ARCHIVE_CONTENT_TYPES.get(request.mimetype)
+    if fmt not in ("zip", "tar"):
+        raise ValueError("无法识别归档格式，请使用 application/zip、application/x-tar 或 ?format=zip|tar")
+
+    if fmt == "tar":
+        return request.stream, fmt
+
+    spool = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    shutil.copyfileobj(request.stream, spool, 1024 * 1024)
+    spool.seek(0)
+    return spool, fmt
+
+
+@app.route("/upload/<category>/archive", methods=["POST"])
+@admitted
+def upload_archive(category):
+    """
+    归档批量上传推理接口
+    逐个读取 ZIP/TAR 中的图像，校验后保存，每 ARCHIVE_BATCH_SIZE 张一起推理；
+    ?details=1 时返回每张图像的完整检测结果
+    """
+    # 归档接口单独放宽请求体大小限制
+    request.max_content_length = ARCHIVE_MAX_BYTES
+    details = request.args.get("details") == "1"
+    try:
+        vis = vis_options(category)
+    except ValueError as e:
+        return make_response(False, str(e), code=400)
+    results = []
+    pending = []
+    counts = {"success": 0, "failed": 0, "skipped": 0}
+
+    def add_result(index, name, status, msg, data=None):
+        results.append({"index": index, "filename": name, "ok": status == "success", "msg": msg, "data": data})
+        counts[status] += 1
+
+    def flush():
+        """对积累的一批图像执行推理"""
+        outputs = run_inference_batch([(item["path"], item["vis_dir"], item["result_id"]) for item in pending],
+                                      batch_size=ARCHIVE_BATCH_SIZE, **vis)
+        for item, output in zip(pending, outputs):
+            if not output.get("success"):
+                add_result(item["index"], item["name"], "failed", output.get("error") or "推理失败")
+                continue
+            output.update({
+                "id": f"{category}_{item['result_id']}",
+                "category": category,
+                "original_filename": item["filename"],
+                "upload_url": image_url("uploads", category, item["path"]),
+                "content_hash": item["content_hash"],
+                "deduplicated": item["deduplicated"],
+                "vis_url": image_url("visualizations", category, output["vis_path"])
+                if output.get("vis_path") else None
+            })
+            record_vis_written(output)
+            record_detections(category, output, item["upload_bytes"])
+            if not details:
+                output = {key: output.get(key) for key in (
+                    "id", "result_id", "original_filename", "class_id", "score",
+                    "detection_count", "upload_url", "vis_url", "vis_bytes")}
+            add_result(item["index"], item["name"], "success", "推理成功", output)
+        pending.clear()
+
+    archive_file = None
+    try:
+        try:
+            archive_file, fmt = open_upload_archive()
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
+
+        for index, (name, data) in enumerate(iter_archive_entries(
+                archive_file, fmt, ARCHIVE_MAX_ENTRIES, ARCHIVE_MAX_TOTAL_BYTES, MAX_FILE_SIZE), start=1):
+            basename = name.replace("\\", "/").rsplit("/", 1)[-1]
+            # 跳过 macOS 附带的元数据文件和隐藏文件
+            if basename.startswith(".") or "__MACOSX/" in name:
+                continue
+            if not is_valid_extension(basename):
+                add_result(index, name, "skipped", "不支持的文件类型，已跳过")
+                continue
+            if data is None:
+                add_result(index, name, "failed", f"文件大小超过限制 ({MAX_FILE_SIZE // (1024 * 1024)}MB)")
+                continue
+
+            try:
+                check_file_content(data, basename)
+                filename = secure_filename(basename)
+                result_id = new_result_id()
+                unique_filename = f"{result_id}_{filename}"
+                upload_dir, vis_dir = result_dirs(category, unique_filename)
+                file_path = upload_dir / unique_filename
+                stored = save_upload(data, file_path)
+            except Exception as e:
+                add_result(index, name, "failed", str(e))
+                continue
+
+            pending.append({
+                "index": index,
+                "name": name,
+                "filename": filename,
+                "result_id": result_id,
+                "path": file_path,
+                "vis_dir": vis_dir,
+                "content_hash": stored["content_hash"],
+                "deduplicated": stored["deduplicated"],
+                "upload_bytes": len(data)
+            })
+            if len(pending) >= ARCHIVE_BATCH_SIZE:
+                flush()
+
+        if pending:
+            flush()
+        results.sort(key=lambda item: item["index"])
+
+        summary = {
+            "total_files": len(results),
+            "success_count": counts["success"],
+            "failed_count": counts["failed"],
+            "skipped_count": counts["skipped"],
+            "results": results
+        }
+        logger.info("归档推理完成: 类别=%s, 成功 %s/%s", category, counts["success"], len(results))
+        return make_response(True, f"归档推理完成，成功 {counts['success']}/{len(results)} 个文件", summary)
+
+    except ArchiveLimitError as e:
+        # 已处理的图像结果保留，客户端可根据 data 中的结果决定如何重试
+        if pending:
+            flush()
+        results.sort(key=lambda item: item["index"])
+        logger.warning("归档超过限制: %s", e)
+        return make_response(False, str(e), {"processed": results}, code=413)
+
+    except RequestEntityTooLarge:
+        return make_response(False, f"归档大小超过限制 ({ARCHIVE_MAX_BYTES // (1024 * 1024)}MB)", code=413)
+
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        return make_response(False, f"归档文件损坏: {str(e)}", code=400)
+
+    except Exception as e:
+        logger.error("归档推理失败: %s", e)
+        return make_response(False, f"归档推理失败: {str(e)}", code=500)
+
+    finally:
+        if archive_file is not None and archive_file is not request.stream:
+            archive_file.close()
+
+
 @app.errorhandler(413)
 def file_too_large(e):
     """文件过大错误处理"""
@@ -247,83 +1031,191 @@ def not_found(e):
 @app.errorhandler(500)
 def internal_error(e):
     """500错误处理"""
-    logger.error(f"内部服务器错误: {str(e)}")
+    logger.error("内部服务器错误: %s", e)
     return make_response(False, "内部服务器错误", code=500)
 
 
+def parse_since(value):
+    """
+    解析增量导出游标
+    支持结果ID（<结果ID> 或 <类别>_<结果ID>）、Unix 时间戳（秒）以及 ISO 格式时间
+    Returns:
+        排序键下界，只返回排序键大于它的结果；未提供游标时返回 None
+    """
+    if value is None or value == "":
+        return None
+
+    value = value.strip()
+    # 结果ID形如 <category>_<key>，类别名本身可能包含下划线
+    key = value.rsplit("_", 1)[-1]
+    if is_result_id(key):
+        return result_sort_key(key)
+    if key.isdigit():
+        if key != value:
+            return result_sort_key(key)
+        # 整秒游标：该秒内的结果都视为已同步
+        return int(key) * 1000 + 999, "~"
+
+    try:
+        from datetime import datetime
+        return int(datetime.fromisoformat(value).timestamp()) * 1000 + 999, "~"
+    except ValueError:
+        raise ValueError(f"无效的 since 游标: {value}")
+
+
+def collect_results(category=None, since=None):
+    """
+    扫描结果目录，按结果ID合并上传文件和可视化文件
+    Args:
+        category: 只扫描指定类别，None 表示全部类别
+        since: parse_since() 返回的游标，只返回比它新的结果
+    Returns:
+        结果列表（最新的在前）
+    """
+    results = []
+    sort_keys = {}
+
+    if not SAVE_ROOT.exists():
+        return results
+
+    upload_dir = SAVE_ROOT / "uploads"
+    vis_dir = SAVE_ROOT / "visualizations"
+
+    if category is not None:
+        categories = {category}
+    else:
+        categories = set()
+        if upload_dir.exists():
+            categories.update([d.name for d in upload_dir.iterdir() if d.is_dir()])
+        if vis_dir.exists():
+            categories.update([d.name for d in vis_dir.iterdir() if d.is_dir()])
+
+    for category in categories:
+        cat_upload_dir = upload_dir / category
+        cat_vis_dir = vis_dir / category
+        cat_sort_keys = {}
+
+        # 获取上传的文件
+        uploaded_files = {}
+        if cat_upload_dir.exists():
+            for file_path in iter_files(cat_upload_dir):
+                # 文件名 <结果ID>_<原始文件名>，旧文件为 <时间戳>_<原始文件名>
+                key = result_key(file_path.name)
+                name_parts = file_path.name.split('_', 1)
+                original_name = name_parts[1] if len(name_parts) >= 2 else file_path.name
+
+                sort_key = result_sort_key(key, file_path)
+                if since is not None and sort_key <= since:
+                    continue
+                cat_sort_keys[key] = sort_key
+
+                # 上传文件是 blob 的硬链接，内容重复时 mtime 是第一次上传的时间，上传时间取自结果ID
+                uploaded_files[key] = {
+                    "original_name": original_name,
+                    "upload_path": str(file_path),
+                    "upload_url": image_url("uploads", category, file_path),
+                    "upload_size": file_path.stat().st_size,
+                    "upload_time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sort_key[0] / 1000))
+                }
+
+        # 获取可视化文件，与上传文件按结果ID直接配对
+        vis_files = {}
+        if cat_vis_dir.exists():
+            for file_path in iter_files(cat_vis_dir):
+                if not file_path.name.startswith('vis_'):
+                    continue
+                key = result_key(file_path.name)
+
+                sort_key = result_sort_key(key, file_path)
+                if since is not None and sort_key <= since:
+                    continue
+                cat_sort_keys.setdefault(key, sort_key)
+
+                st = file_path.stat()
+                vis_files[key] = {
+                    "vis_path": str(file_path),
+                    "vis_url": image_url("visualizations", category, file_path),
+                    "vis_size": st.st_size,
+                    "vis_time": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(st.st_mtime))
+                }
+
+        # 合并结果
+        for key, sort_key in cat_sort_keys.items():
+            result_item = {
+                "id": f"{category}_{key}",
+                "result_id": key,
+                "category": category,
+                "timestamp": str(sort_key[0] // 1000),
+                "upload_info": uploaded_files.get(key),
+                "visualization_info": vis_files.get(key)
+            }
+            results.append(result_item)
+            sort_keys[id(result_item)] = sort_key
+
+    # 按结果ID排序（最新的在前）
+    results.sort(key=lambda x: sort_keys[id(x)], reverse=True)
+    return results
+
+
+def next_cursor(results, default=None):
+    """
+    计算下一次增量同步使用的游标（本次返回结果中已完成的最新结果ID）
+    上传文件在推理之前写盘，只有上传文件、还没有可视化图像且生成不足 CURSOR_PENDING_SECONDS 秒的结果
+    视为仍在推理中。游标停在最早一个推理中的结果之前：更新的结果先完成时游标不会越过它，
+    否则它的可视化图像写入后排在游标之前，之后的增量同步再也不会返回；
+    停住期间已返回过的结果下次会再返回一次，客户端按结果ID去重即可
+    """
+    def sort_key(r):
+        return int(r["timestamp"]), r["result_id"]
+
+    now = time.time()
+    pending = [r for r in results
+               if r["upload_info"] and not r["visualization_info"] and now - int(r["timestamp"]) < CURSOR_PENDING_SECONDS]
+    if pending:
+        oldest = min(map(sort_key, pending))
+        results = [r for r in results if sort_key(r) < oldest]
+    if results:
+        return max(results, key=sort_key)["result_id"]
+    return default
+
+
+def result_entries(results, flat=False):
+    """
+    把结果列表展开为 ZIP 条目
+    Args:
+        results: collect_results() 的返回值
+        flat: True 时不带类别子目录（按类别下载时使用）
+    """
+    entries = []
+    for r in results:
+        prefix = "" if flat else f"{r['category']}/"
+        if r["upload_info"]:
+            file_path = Path(r["upload_info"]["upload_path"])
+            entries.append((f"uploads/{prefix}{relative_path('uploads', r['category'], file_path)}", file_path))
+        if r["visualization_info"]:
+            file_path = Path(r["visualization_info"]["vis_path"])
+            entries.append((f"visualizations/{prefix}{relative_path('visualizations', r['category'], file_path)}",
+                            file_path))
+    return entries
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Prometheus 指标"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+
 @app.route("/results", methods=["GET"])
 def list_results():
-    """获取所有推理结果列表"""
+    """获取所有推理结果列表，支持 ?since= 增量查询"""
     try:
-        results = []
+        try:
+            since_arg = request.args.get("since")
+            since = parse_since(since_arg)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
 
-        # 遍历所有类别目录
-        if SAVE_ROOT.exists():
-            upload_dir = SAVE_ROOT / "uploads"
-            vis_dir = SAVE_ROOT / "visualizations"
-
-            categories = set()
-            if upload_dir.exists():
-                categories.update([d.name for d in upload_dir.iterdir() if d.is_dir()])
-            if vis_dir.exists():
-                categories.update([d.name for d in vis_dir.iterdir() if d.is_dir()])
-
-            for category in categories:
-                cat_upload_dir = upload_dir / category
-                cat_vis_dir = vis_dir / category
-
-                # 获取上传的文件
-                uploaded_files = {}
-                if cat_upload_dir.exists():
-                    for file_path in cat_upload_dir.iterdir():
-                        if file_path.is_file():
-                            # 提取时间戳和原始文件名
-                            name_parts = file_path.name.split('_', 1)
-                            if len(name_parts) >= 2:
-                                timestamp = name_parts[0]
-                                original_name = '_'.join(name_parts[1:])
-                            else:
-                                timestamp = str(int(file_path.stat().st_mtime))
-                                original_name = file_path.name
-
-                            uploaded_files[timestamp] = {
-                                "original_name": original_name,
-                                "upload_path": str(file_path),
-                                "upload_size": file_path.stat().st_size,
-                                "upload_time": time.strftime('%Y-%m-%d %H:%M:%S',
-                                                             time.localtime(file_path.stat().st_mtime))
-                            }
-
-                # 获取可视化文件
-                vis_files = {}
-                if cat_vis_dir.exists():
-                    for file_path in cat_vis_dir.iterdir():
-                        if file_path.is_file() and file_path.name.startswith('vis_'):
-                            # 提取时间戳
-                            name_parts = file_path.stem.split('_')
-                            timestamp = name_parts[-1] if name_parts else str(int(file_path.stat().st_mtime))
-
-                            vis_files[timestamp] = {
-                                "vis_path": str(file_path),
-                                "vis_size": file_path.stat().st_size,
-                                "vis_time": time.strftime('%Y-%m-%d %H:%M:%S',
-                                                          time.localtime(file_path.stat().st_mtime))
-                            }
-
-                # 合并结果
-                all_timestamps = set(uploaded_files.keys()) | set(vis_files.keys())
-                for timestamp in all_timestamps:
-                    result_item = {
-                        "id": f"{category}_{timestamp}",
-                        "category": category,
-                        "timestamp": timestamp,
-                        "upload_info": uploaded_files.get(timestamp),
-                        "visualization_info": vis_files.get(timestamp)
-                    }
-                    results.append(result_item)
-
-        # 按时间排序（最新的在前）
-        results.sort(key=lambda x: x["timestamp"], reverse=True)
+        results = collect_results(since=since)
 
         summary = {
             "total_results": len(results),
@@ -334,56 +1226,224 @@ def list_results():
 
         data = {
             "summary": summary,
-            "results": results
+            "results": results,
+            "next_cursor": next_cursor(results, since_arg)
         }
 
-        logger.info(f"获取结果列表成功，共 {len(results)} 条记录")
+        logger.info("获取结果列表成功，共 %s 条记录", len(results))
         return make_response(True, f"获取到 {len(results)} 条推理结果", data)
 
     except Exception as e:
-        logger.error(f"获取结果列表失败: {str(e)}")
+        logger.error("获取结果列表失败: %s", e)
         return make_response(False, f"获取结果列表失败: {str(e)}", code=500)
 
 
+@app.route("/results/manifest", methods=["GET"])
+@app.route("/results/manifest/<category>", methods=["GET"])
+def results_manifest(category=None):
+    """
+    以 JSONL 格式导出结果清单，每行一条结果
+    支持 ?since= 增量游标，新游标通过 X-Next-Cursor 响应头返回
+    """
+    try:
+        try:
+            since_arg = request.args.get("since")
+            since = parse_since(since_arg)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
+
+        # 增量同步按时间正序输出，便于消费方断点续传
+        results = collect_results(category, since=since)
+        results.reverse()
+        cursor = next_cursor(results, since_arg)
+
+        def generate():
+            for r in results:
+                yield json.dumps(r, ensure_ascii=False) + "\n"
+
+        logger.info("导出结果清单: 类别=%s, since=%s, 共 %s 条", category or '全部', since_arg, len(results))
+
+        headers = {"X-Result-Count": str(len(results))}
+        if cursor is not None:
+            headers["X-Next-Cursor"] = cursor
+        return Response(generate(), mimetype="application/x-ndjson", headers=headers)
+
+    except Exception as e:
+        logger.error("导出结果清单失败: %s", e)
+        return make_response(False, f"导出结果清单失败: {str(e)}", code=500)
+
+
+@app.route("/results/stats", methods=["GET"])
+@app.route("/results/stats/<category>", methods=["GET"])
+def results_stats(category=None):
+    """
+    聚合统计：按类别和检测类别的结果数、检测数、置信度直方图、每小时吞吐量和写入字节数
+    统计随检测记录增量更新，没有新记录时直接返回缓存结果，不扫描结果目录
+    """
+    try:
+        summary = stats_aggregator.summary(category)
+        if summary is None:
+            return make_response(False, f"类别 '{category}' 没有检测记录", code=404)
+        return make_response(True, "获取统计成功", summary)
+
+    except Exception as e:
+        logger.error("获取统计失败: %s", e)
+        return make_response(False, f"获取统计失败: {str(e)}", code=500)
+
+
+@app.route("/admin/profiles", methods=["GET"])
+@admin_required
+def list_profiles():
+    """已保存的单请求剖析结果"""
+    return make_response(True, "获取剖析结果成功", request_profiler.profiles())
+
+
+@app.route("/admin/profiles/<profile_id>", methods=["GET"])
+@admin_required
+def download_profile(profile_id):
+    """
+    下载单请求剖析结果 (.prof，可用 snakeviz / python -m pstats 打开)
+    ?format=text 时返回 pstats 文本报告，可用 ?sort=cumulative|tottime 和 ?limit= 调整
+    """
+    try:
+        path = request_profiler.path(profile_id)
+        if path is None:
+            return make_response(False, "剖析结果不存在", code=404)
+
+        if request.args.get("format") == "text":
+            sort = request.args.get("sort", "cumulative")
+            if sort not in ("cumulative", "tottime", "ncalls", "calls", "time"):
+                return make_response(False, f"不支持的排序方式: {sort}", code=400)
+            report = request_profiler.report(profile_id, sort, request.args.get("limit", 50, type=int))
+            return Response(report, mimetype="text/plain")
+
+        return send_file(path.resolve(), mimetype="application/octet-stream", as_attachment=True,
+                         download_name=path.name)
+
+    except Exception as e:
+        logger.error("下载剖析结果失败: %s", e)
+        return make_response(False, f"下载剖析结果失败: {str(e)}", code=500)
+
+
+@app.route("/admin/profiling/sampler", methods=["GET", "POST"])
+@admin_required
+def profiling_sampler():
+    """
+    查看或切换采样剖析
+    POST {"enabled": true, "interval_ms": 10}；多进程部署时每个工作进程各自采样，状态中的 pid 标明进程
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        if body.get("enabled", True):
+            interval_ms = body.get("interval_ms")
+            if interval_ms is not None and not (isinstance(interval_ms, (int, float)) and interval_ms >= 1):
+                return make_response(False, "interval_ms 应为不小于 1 的数字", code=400)
+            sampling_profiler.start(interval_ms / 1000 if interval_ms else None)
+        else:
+            sampling_profiler.stop()
+    return make_response(True, "获取采样剖析状态成功", sampling_profiler.status())
+
+
+@app.route("/admin/profiling/stacks", methods=["GET"])
+@admin_required
+def profiling_stacks():
+    """
+    采样得到的 collapsed stacks，可直接交给 flamegraph.pl 或导入 speedscope
+    ?reset=1 时返回后清空
+    """
+    text = sampling_profiler.collapsed()
+    if request.args.get("reset") == "1":
+        sampling_profiler.reset()
+    return Response(text, mimetype="text/plain", headers={"X-Worker-PID": str(os.getpid())})
+
+
+@app.route("/results/export", methods=["GET"])
+@app.route("/results/export/<category>", methods=["GET"])
+def export_results(category=None):
+    """
+    导出检测结果: ?format=parquet (默认) / arrow / coco / yolo / jsonl
+    边读取检测记录边输出，不在内存或磁盘上生成完整文件
+    """
+    try:
+        fmt = request.args.get("format", "parquet")
+        try:
+            check_format(fmt)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
+        except ImportError as e:
+            return make_response(False, str(e), code=501)
+
+        if category and not record_files(SAVE_ROOT, category):
+            return make_response(False, f"类别 '{category}' 没有检测记录", code=404)
+
+        mimetype, extension = EXPORT_FORMATS[fmt]
+
+        def generate():
+            start = time.time()
+            try:
+                yield from iter_export(iter_records(SAVE_ROOT, category), fmt)
+            except Exception as e:
+                logger.error("导出检测结果中断: %s", e)
+                raise
+            logger.info("导出检测结果完成: 类别=%s, 格式=%s, 耗时 %.2fs", category or '全部', fmt, time.time() - start)
+
+        return Response(generate(), mimetype=mimetype,
+                        headers=attachment_headers(f"detections_{category or 'all'}{extension}"))
+
+    except Exception as e:
+        logger.error("导出检测结果失败: %s", e)
+        return make_response(False, f"导出检测结果失败: {str(e)}", code=500)
+
+
 @app.route("/results/download", methods=["GET"])
 def download_all_results():
-    """打包下载所有推理结果"""
+    """打包下载所有推理结果（流式生成，不落临时文件），支持 ?since= 增量导出"""
     try:
-        import zipfile
-        import tempfile
-        from flask import send_file
-
-        # 创建临时ZIP文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as tmp_file:
-            zip_path = tmp_file.name
+        try:
+            since_arg = request.args.get("since")
+            since = parse_since(since_arg)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
 
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            file_count = 0
+        if since is None:
+            entries = []
 
             # 添加上传的原始文件
             upload_dir = SAVE_ROOT / "uploads"
             if upload_dir.exists():
                 for file_path in upload_dir.rglob("*"):
                     if file_path.is_file():
-                        arcname = f"uploads/{file_path.relative_to(upload_dir)}"
-                        zipf.write(file_path, arcname)
-                        file_count += 1
+                        entries.append((f"uploads/{file_path.relative_to(upload_dir).as_posix()}", file_path))
 
             # 添加可视化结果文件
             vis_dir = SAVE_ROOT / "visualizations"
             if vis_dir.exists():
                 for file_path in vis_dir.rglob("*"):
                     if file_path.is_file():
-                        arcname = f"visualizations/{file_path.relative_to(vis_dir)}"
-                        zipf.write(file_path, arcname)
-                        file_count += 1
+                        entries.append((f"visualizations/{file_path.relative_to(vis_dir).as_posix()}", file_path))
+
+            cursor = next_cursor(collect_results())
+        else:
+            results = collect_results(since=since)
+            if not results:
+                # 没有新结果，直接返回游标，不生成空压缩包
+                return Response(status=204, headers={"X-Next-Cursor": since_arg})
+            entries = result_entries(results)
+            cursor = next_cursor(results, since_arg)
+
+        # 生成下载文件名
+        download_filename = f"inference_results_{time.strftime('%Y%m%d_%H%M%S')}.zip"
 
-            # 创建结果摘要文件
+        def readme(file_count):
+            """所有文件写完后追加结果摘要文件"""
+            logger.info("结果打包完成: %s, 包含 %s 个文件", download_filename, file_count)
             summary_content = f"""推理结果摘要
 ===================
 打包时间: {time.strftime('%Y-%m-%d %H:%M:%S')}
 文件总数: {file_count}
 打包路径: {SAVE_ROOT}
+增量起点: {since_arg or '全部'}
+下次游标: {cursor}
 
 目录结构:
 - uploads/     : 用户上传的原始图像文件
@@ -392,41 +1452,88 @@ def download_all_results():
 使用说明:
 1. uploads/ 目录包含所有上传的原始图像
 2. visualizations/ 目录包含带检测框的结果图像
-3. 文件名中的时间戳可以用来关联原图和结果图
+3. 文件名开头的结果ID可以用来关联原图和结果图
+4. 下次同步时带上 ?since=<下次游标> 即可只获取新增结果
 """
-            zipf.writestr("README.txt", summary_content)
-
-        # 生成下载文件名
-        download_filename = f"inference_results_{time.strftime('%Y%m%d_%H%M%S')}.zip"
+            return [("README.txt", summary_content)]
 
-        logger.info(f"生成结果打包文件: {download_filename}, 包含 {file_count} 个文件")
+        logger.info("开始流式打包: %s, 共 %s 个文件", download_filename, len(entries))
 
-        def remove_file():
-            """下载完成后删除临时文件"""
-            try:
-                Path(zip_path).unlink()
-            except:
-                pass
-
-        return send_file(
-            zip_path,
-            as_attachment=True,
-            download_name=download_filename,
-            mimetype='application/zip'
+        headers = attachment_headers(download_filename)
+        if cursor is not None:
+            headers["X-Next-Cursor"] = cursor
+        return Response(
+            iter_zip(entries, trailer=readme),
+            mimetype='application/zip',
+            headers=headers
         )
 
     except Exception as e:
-        logger.error(f"打包下载失败: {str(e)}")
+        logger.error("打包下载失败: %s", e)
         return make_response(False, f"打包下载失败: {str(e)}", code=500)
 
 
+def send_cached_category_archive(category, entries):
+    """
+    发送按类别缓存的归档
+    支持 ETag/Last-Modified 条件请求（未变化时返回 304）和 Range 断点续传
+    """
+    readme = f"""类别推理结果摘要
+===================
+类别: {category}
+
+目录结构:
+- uploads/     : 该类别的原始图像文件
+- visualizations/ : 该类别的结果可视化图像文件
+
+说明:
+该归档会在新结果产生后增量追加，可使用 ETag / Range 请求断点续传
+"""
+    with archive_cache.acquire(category, entries, readme) as info:
+        # 归档在锁内打开，只读取本次 ETag 对应版本的字节，之后的追加不影响这次下载
+        response = Response(wrap_file(request.environ, info["file"]), mimetype="application/zip",
+                            headers=attachment_headers(f"inference_results_{category}.zip"),
+                            direct_passthrough=True)
+    response.content_length = info["size"]
+    response.set_etag(info["etag"])
+    response.last_modified = info["last_modified"]
+    response.cache_control.no_cache = True
+    response.make_conditional(request.environ, accept_ranges=True, complete_length=info["size"])
+    CACHE_REQUESTS.inc("archive", info["status"])
+
+    # 304 / 断点续传的 206 不需要游标，只有完整下载时才从归档条目中计算
+    if response.status_code == 200:
+        found = {}
+        for arcname, file_path in entries:
+            key = result_key(Path(file_path).name)
+            item = found.setdefault(key, {
+                "result_id": key,
+                "timestamp": str(result_sort_key(key, file_path)[0] // 1000),
+                "upload_info": None,
+                "visualization_info": None
+            })
+            item["upload_info" if arcname.startswith("uploads/") else "visualization_info"] = arcname
+        cursor = next_cursor(list(found.values()))
+        if cursor is not None:
+            response.headers["X-Next-Cursor"] = cursor
+    response.headers["X-Archive-Cache"] = info["status"]
+
+    logger.info("发送类别归档缓存: %s, 状态: %s, 状态码: %s", category, info['status'], response.status_code)
+    return response
+
+
 @app.route("/results/download/<category>", methods=["GET"])
 def download_category_results(category):
-    """按类别下载推理结果"""
+    """
+    按类别下载推理结果
+    全量下载使用可增量追加的归档缓存；带 ?since= 的增量导出流式生成
+    """
     try:
-        import zipfile
-        import tempfile
-        from flask import send_file
+        try:
+            since_arg = request.args.get("since")
+            since = parse_since(since_arg)
+        except ValueError as e:
+            return make_response(False, str(e), code=400)
 
         # 检查类别是否存在
         cat_upload_dir = SAVE_ROOT / "uploads" / category
@@ -435,147 +1542,231 @@ def download_category_results(category):
         if not (cat_upload_dir.exists() or cat_vis_dir.exists()):
             return make_response(False, f"类别 '{category}' 不存在", code=404)
 
-        # 创建临时ZIP文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as tmp_file:
-            zip_path = tmp_file.name
-
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            file_count = 0
+        if since is None:
+            entries = []
 
             # 添加该类别的上传文件
             if cat_upload_dir.exists():
-                for file_path in cat_upload_dir.iterdir():
-                    if file_path.is_file():
-                        zipf.write(file_path, f"uploads/{file_path.name}")
-                        file_count += 1
+                for file_path in iter_files(cat_upload_dir):
+                    entries.append((f"uploads/{relative_path('uploads', category, file_path)}", file_path))
 
             # 添加该类别的可视化文件
             if cat_vis_dir.exists():
-                for file_path in cat_vis_dir.iterdir():
-                    if file_path.is_file():
-                        zipf.write(file_path, f"visualizations/{file_path.name}")
-                        file_count += 1
+                for file_path in iter_files(cat_vis_dir):
+                    entries.append((f"visualizations/{relative_path('visualizations', category, file_path)}", file_path))
 
-            if file_count == 0:
+            if not entries:
                 return make_response(False, f"类别 '{category}' 下没有文件", code=404)
 
-            # 创建类别摘要文件
+            return send_cached_category_archive(category, entries)
+        else:
+            results = collect_results(category, since=since)
+            if not results:
+                return Response(status=204, headers={"X-Next-Cursor": since_arg})
+            entries = result_entries(results, flat=True)
+            cursor = next_cursor(results, since_arg)
+
+        # 生成下载文件名
+        download_filename = f"inference_results_{category}_{time.strftime('%Y%m%d_%H%M%S')}.zip"
+
+        def readme(file_count):
+            """所有文件写完后追加类别摘要文件"""
+            logger.info("类别打包完成: %s, 包含 %s 个文件", download_filename, file_count)
             summary_content = f"""类别推理结果摘要
 ===================
 类别: {category}
 打包时间: {time.strftime('%Y-%m-%d %H:%M:%S')}
 文件总数: {file_count}
+增量起点: {since_arg or '全部'}
+下次游标: {cursor}
 
 目录结构:
 - uploads/     : 该类别的原始图像文件
 - visualizations/ : 该类别的结果可视化图像文件
 """
-            zipf.writestr("README.txt", summary_content)
-
-        # 生成下载文件名
-        download_filename = f"inference_results_{category}_{time.strftime('%Y%m%d_%H%M%S')}.zip"
+            return [("README.txt", summary_content)]
 
-        logger.info(f"生成类别打包文件: {download_filename}, 包含 {file_count} 个文件")
+        logger.info("开始流式打包类别: %s, 共 %s 个文件", download_filename, len(entries))
 
-        return send_file(
-            zip_path,
-            as_attachment=True,
-            download_name=download_filename,
-            mimetype='application/zip'
+        headers = attachment_headers(download_filename)
+        if cursor is not None:
+            headers["X-Next-Cursor"] = cursor
+        return Response(
+            iter_zip(entries, trailer=readme),
+            mimetype='application/zip',
+            headers=headers
         )
 
     except Exception as e:
-        logger.error(f"按类别打包下载失败: {str(e)}")
+        logger.error("按类别打包下载失败: %s", e)
         return make_response(False, f"按类别打包下载失败: {str(e)}", code=500)
 
 
+@app.route("/results/image/<kind>/<category>/<path:filename>", methods=["GET"])
+def serve_image(kind, category, filename):
+    """
+    访问上传原图或可视化结果图
+    ?size=small|medium|large 返回磁盘缓存的缩略图，不带参数时返回原图；
+    支持 ETag/Last-Modified 条件请求，文件通过 wsgi.file_wrapper（sendfile）发送
+    """
+    try:
+        if kind not in ("uploads", "visualizations"):
+            return make_response(False, "请求的资源不存在", code=404)
+
+        size = request.args.get("size")
+        if size and size not in THUMBNAIL_SIZES:
+            return make_response(False, f"不支持的缩略图尺寸，支持: {', '.join(THUMBNAIL_SIZES)}", code=400)
+
+        # safe_join 防止通过 .. 访问结果目录之外的文件
+        src = safe_join(str(SAVE_ROOT / kind), category, filename)
+        if src is None or not Path(src).is_file():
+            return make_response(False, "请求的资源不存在", code=404)
+        src = Path(src)
+
+        if size:
+            path = thumbnail_path(THUMBNAIL_DIR, kind, category, filename, size)
+            hit = get_thumbnail(src, path, size)
+            CACHE_REQUESTS.inc("thumbnail", "hit" if hit else "miss")
+        else:
+            path = src
+
+        return send_file(path.resolve(), conditional=True, max_age=IMAGE_CACHE_MAX_AGE)
+
+    except Exception as e:
+        logger.error("获取图像失败: %s", e)
+        return make_response(False, f"获取图像失败: {str(e)}", code=500)
+
+
+@app.route("/results/retention", methods=["GET"])
+def retention_status():
+    """查看保留策略配置和最近一次淘汰统计"""
+    data = {
+        "enabled": retention_manager.enabled,
+        "max_age_days": RETENTION_MAX_AGE_DAYS,
+        "category_quota_mb": RETENTION_CATEGORY_QUOTA_MB,
+        "category_quotas_mb": RETENTION_CATEGORY_QUOTAS,
+        "global_quota_mb": RETENTION_GLOBAL_QUOTA_MB,
+        "interval_seconds": RETENTION_INTERVAL,
+        "status": retention_manager.status()
+    }
+    return make_response(True, "获取保留策略状态成功", data)
+
+
 @app.route("/results/clean", methods=["DELETE"])
 def clean_results():
-    """清理所有推理结果"""
+    """
+    清理所有推理结果
+    结果目录先整体移入回收站并立即重建空目录，删除在后台进行，接口不等待；
+    .cache 中的 leader.lock、统计快照和清理任务状态仍在使用，不随结果清理；
+    其中的缩略图缓存随结果一起移入回收站（按需重新生成），归档缓存失效
+    """
     try:
-        import shutil
+        targets = []
+        if SAVE_ROOT.exists():
+            targets = [item for item in SAVE_ROOT.iterdir() if item not in (TRASH_DIR, SAVE_ROOT / ".cache")]
+            targets.append(THUMBNAIL_DIR)
 
-        deleted_files = 0
-        deleted_dirs = 0
+        job = trash_collector.submit(targets, "清理所有推理结果")
 
-        if SAVE_ROOT.exists():
-            for item in SAVE_ROOT.iterdir():
-                if item.is_file():
-                    item.unlink()
-                    deleted_files += 1
-                elif item.is_dir():
-                    shutil.rmtree(item)
-                    deleted_dirs += 1
-
-        # 重新创建必要的目录
+        # 重新创建必要的目录，新的上传不受影响
         (SAVE_ROOT / "uploads").mkdir(parents=True, exist_ok=True)
         (SAVE_ROOT / "visualizations").mkdir(parents=True, exist_ok=True)
+        archive_cache.invalidate()
 
-        logger.info(f"清理完成: 删除 {deleted_files} 个文件, {deleted_dirs} 个目录")
-        return make_response(True, f"清理完成，删除了 {deleted_files} 个文件和 {deleted_dirs} 个目录")
+        logger.info("清理任务已提交: %s, 移入回收站 %s 项", job['job_id'], job['moved'])
+        return make_response(True, f"清理任务已提交，{job['moved']} 项已移入回收站，后台删除中", job, code=202)
 
     except Exception as e:
-        logger.error(f"清理失败: {str(e)}")
+        logger.error("清理失败: %s", e)
         return make_response(False, f"清理失败: {str(e)}", code=500)
 
 
 @app.route("/results/clean/<category>", methods=["DELETE"])
 def clean_category_results(category):
-    """清理指定类别的推理结果"""
+    """
+    清理指定类别的推理结果
+    类别目录移入回收站后立即返回，删除在后台进行
+    """
     try:
-        import shutil
-
-        deleted_files = 0
-
-        # 清理上传文件
+        # 清理上传文件和可视化文件
         cat_upload_dir = SAVE_ROOT / "uploads" / category
-        if cat_upload_dir.exists():
-            for file_path in cat_upload_dir.iterdir():
-                if file_path.is_file():
-                    file_path.unlink()
-                    deleted_files += 1
-            # 如果目录为空则删除
-            try:
-                cat_upload_dir.rmdir()
-            except OSError:
-                pass
-
-        # 清理可视化文件
         cat_vis_dir = SAVE_ROOT / "visualizations" / category
-        if cat_vis_dir.exists():
-            for file_path in cat_vis_dir.iterdir():
-                if file_path.is_file():
-                    file_path.unlink()
-                    deleted_files += 1
-            # 如果目录为空则删除
-            try:
-                cat_vis_dir.rmdir()
-            except OSError:
-                pass
+        cat_records_dir = SAVE_ROOT / RECORDS_DIR / category
+
+        job = trash_collector.submit([cat_upload_dir, cat_vis_dir, cat_records_dir], f"清理类别 {category}")
+
+        archive_cache.invalidate(category)
+        remove_category_thumbnails(THUMBNAIL_DIR, category)
 
-        if deleted_files == 0:
+        if job["moved"] == 0:
             return make_response(False, f"类别 '{category}' 不存在或已为空", code=404)
 
-        logger.info(f"清理类别 {category} 完成: 删除 {deleted_files} 个文件")
-        return make_response(True, f"清理类别 '{category}' 完成，删除了 {deleted_files} 个文件")
+        logger.info("清理类别 %s 任务已提交: %s", category, job['job_id'])
+        return make_response(True, f"清理类别 '{category}' 任务已提交，后台删除中", job, code=202)
 
     except Exception as e:
-        logger.error(f"清理类别失败: {str(e)}")
+        logger.error("清理类别失败: %s", e)
         return make_response(False, f"清理类别失败: {str(e)}", code=500)
 
 
-if __name__ == "__main__":
-    # 创建必要的目录
+@app.route("/results/clean/jobs", methods=["GET"])
+def list_clean_jobs():
+    """查看最近的后台清理任务"""
+    return make_response(True, "获取清理任务成功", trash_collector.jobs())
+
+
+@app.route("/results/clean/jobs/<job_id>", methods=["GET"])
+def clean_job_status(job_id):
+    """查看后台清理任务进度"""
+    job = trash_collector.job(job_id)
+    if job is None:
+        return make_response(False, f"清理任务 '{job_id}' 不存在", code=404)
+    return make_response(True, "获取清理任务成功", job)
+
+
+def start_background_services(retention: bool = True):
+    """
+    创建结果目录并启动后台任务
+    Args:
+        retention: 是否在本进程运行保留策略、回收站残留清理和磁盘占用统计；多进程部署时只需一个进程运行
+    """
     SAVE_ROOT.mkdir(parents=True, exist_ok=True)
     (SAVE_ROOT / "uploads").mkdir(parents=True, exist_ok=True)
     (SAVE_ROOT / "visualizations").mkdir(parents=True, exist_ok=True)
 
+    if PROFILE_SAMPLING and PROFILE_ADMIN_TOKEN:
+        sampling_profiler.start()
+
+    if not retention:
+        return
+
+    # 继续删除上次退出时回收站中的残留
+    trash_collector.recover()
+    usage_monitor.start()
+
+    # 启动后台保留策略（未配置任何限制时不启动）
+    if retention_manager.enabled:
+        retention_manager.start()
+
+
+def stop_background_services():
+    """停止后台任务，用于进程优雅退出"""
+    retention_manager.stop()
+    usage_monitor.stop()
+    sampling_profiler.stop()
+    stats_aggregator.flush()
+
+
+if __name__ == "__main__":
     # 检查静态文件目录
     static_dir = Path("static")
     static_dir.mkdir(exist_ok=True)
 
     logger.info("Flask 服务器启动中...")
-    logger.info(f"访问地址: http://localhost:5000/")
-    logger.info(f"结果保存目录: {SAVE_ROOT}")
+    logger.info("访问地址: http://localhost:5000/")
+    logger.info("结果保存目录: %s", SAVE_ROOT)
+    logger.info("当前为开发服务器，生产环境请使用 python serve.py 启动")
+
+    start_background_services()
 
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5000, debug=os.environ.get("FLASK_DEBUG", "1") == "1")
\ No newline at end of file
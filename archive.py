@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+结果打包模块
+以流式方式生成 ZIP 归档：边打包边发送，不落临时文件，内存占用有上限；
+另提供按类别缓存、可增量追加的归档，以及逐个读取上传归档中文件的工具
+"""
+
+import os
+import json
+import uuid
+import tarfile
+import zipfile
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from urllib.parse import quote
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下只有单进程开发服务器，进程内的线程锁已足够
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 已经是压缩格式的图像直接以 STORED 方式写入，重复压缩只会浪费 CPU
+STORED_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".zip"}
+# 读取源文件和向客户端输出的块大小
+CHUNK_SIZE = 256 * 1024
+
+
+class StreamBuffer:
+    """
+    只写、不可 seek 的缓冲区
+    ZipFile 检测到不可 seek 时会改用 data descriptor 写法，
+    写入的数据由生成器分块取走，缓冲区最多只保留一个块左右的数据
+    """
+
+    # pyarrow 写入前会检查 closed
+    closed = False
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def pending(self) -> int:
+        return len(self._buf)
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def compress_type_for(name: str) -> int:
+    """按文件后缀选择压缩方式：图像直接存储，文本/JSON 使用 DEFLATE"""
+    return zipfile.ZIP_STORED if Path(name).suffix.lower() in STORED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def iter_zip(entries, trailer=None):
+    """
+    流式生成 ZIP 数据
+    Args:
+        entries: 可迭代的 (arcname, 文件路径) 序列
+        trailer: 可选回调，参数为已写入的文件数，返回 [(arcname, 文本或bytes)]，
+                 在所有文件之后写入（如 README.txt）
+    Yields:
+        ZIP 字节块
+    """
+    buf = StreamBuffer()
+    file_count = 0
+
+    with zipfile.ZipFile(buf, "w") as zipf:
+        for arcname, file_path in entries:
+            try:
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = compress_type_for(arcname)
+                with open(file_path, "rb") as src, zipf.open(zinfo, "w") as dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        dst.write(chunk)
+                        if buf.pending() >= CHUNK_SIZE:
+                            yield buf.drain()
+            except FileNotFoundError:
+                # 打包期间文件被清理，跳过即可
+                logger.warning("打包时文件已不存在，跳过: %s", file_path)
+                continue
+
+            file_count += 1
+            if buf.pending():
+                yield buf.drain()
+
+        if trailer is not None:
+            for arcname, content in trailer(file_count):
+                if isinstance(content, str):
+                    content = content.encode("utf-8")
+                zipf.writestr(arcname, content, compress_type=compress_type_for(arcname))
+
+    # 关闭 ZipFile 时才写出中央目录
+    yield buf.drain()
+
+
+def attachment_headers(filename: str) -> dict:
+    """生成下载用的 Content-Disposition 头，兼容非 ASCII 文件名"""
+    try:
+        filename.encode("ascii")
+        value = f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        value = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return {"Content-Disposition": value}
+
+class ArchiveLimitError(ValueError):
+    """上传的归档超过文件数或解压后大小限制"""
+
+
+def iter_archive_entries(fileobj, fmt: str, max_entries: int, max_total_bytes: int, max_entry_bytes: int):
+    """
+    逐个读取上传归档中的普通文件，不解压到磁盘，同一时刻只有一个文件的内容在内存中
+    Args:
+        fileobj: 归档文件对象；ZIP 需要可 seek，TAR（含 gz/bz2/xz）可以是只读的请求流
+        fmt: "zip" 或 "tar"
+        max_entries: 最多文件数
+        max_total_bytes: 解压后的总字节数上限
+        max_entry_bytes: 单个文件的字节数上限
+    Yields:
+        (归档内路径, 文件内容)；单个文件超过大小限制时内容为 None
+    Raises:
+        ArchiveLimitError: 文件数或总大小超过限制
+    """
+    count = 0
+    total = 0
+
+    def check(size):
+        nonlocal count, total
+        count += 1
+        total += size
+        if count > max_entries:
+            raise ArchiveLimitError(f"归档中的文件数超过限制 ({max_entries})")
+        if total > max_total_bytes:
+            raise ArchiveLimitError(f"归档解压后大小超过限制 ({max_total_bytes // (1024 * 1024)}MB)")
+
+    if fmt == "zip":
+        with zipfile.ZipFile(fileobj) as zf:
+            infos = [info for info in zf.infolist() if not info.is_dir()]
+            # 先按中央目录中声明的大小检查，解压炸弹在读取任何内容之前就会被拒绝
+            if len(infos) > max_entries:
+                raise ArchiveLimitError(f"归档中的文件数超过限制 ({max_entries})")
+            if sum(info.file_size for info in infos) > max_total_bytes:
+                raise ArchiveLimitError(f"归档解压后大小超过限制 ({max_total_bytes // (1024 * 1024)}MB)")
+
+            for info in infos:
+                if info.file_size > max_entry_bytes:
+                    check(0)
+                    yield info.filename, None
+                    continue
+                with zf.open(info) as f:
+                    # 声明的大小可能是伪造的，按实际读出的字节数再限制一次
+                    data = f.read(max_entry_bytes + 1)
+                check(len(data))
+                yield info.filename, data if len(data) <= max_entry_bytes else None
+        return
+
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tf:
+        for member in tf:
+            if not member.isfile():
+                continue
+            if member.size > max_entry_bytes:
+                check(0)
+                yield member.name, None
+                continue
+            check(member.size)
+            yield member.name, tf.extractfile(member).read()
+
+
+class SnapshotFile:
+    """
+    只读取文件前 size 字节的只读文件对象
+    归档追加时只在末尾写入，已有字节不变；读者按打开时的大小读取，得到的始终是完整的旧版本
+    """
+
+    def __init__(self, path: Path, size: int):
+        self._file = open(path, "rb")
+        self.size = size
+
+    def read(self, n: int = -1) -> bytes:
+        remaining = self.size - self._file.tell()
+        if remaining <= 0:
+            return b""
+        return self._file.read(remaining if n is None or n < 0 else min(n, remaining))
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_END:
+            return self._file.seek(self.size + offset)
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+class ArchiveCache:
+    """
+    按类别缓存 ZIP 归档
+    新结果到达后在归档末尾原地追加新条目和新的中央目录，已有字节不改写，开销只与新条目有关；
+    读者按打开时的大小读取（SnapshotFile），追加不影响正在进行的下载。
+    被旧中央目录占用的空间超过 max_garbage_ratio 或已缓存的文件被删除、修改时整体重建，
+    重建写入唯一命名的临时文件再原子替换。
+    每个版本有唯一的版本号，写在 ZIP 注释中并用作 ETag，归档字节变化时 ETag 一定变化；
+    多个工作进程之间用 <类别>.lock 上的 flock 串行化更新（锁文件本身不会被替换，锁始终有效）
+    """
+
+    def __init__(self, cache_dir: Path, max_garbage_ratio: float = 0.25):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_garbage_ratio: 旧中央目录占归档大小的比例超过该值时重建而不是追加
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_garbage_ratio = max_garbage_ratio
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def _lock(self, category: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(category, threading.Lock())
+
+    @contextmanager
+    def _exclusive(self, category: str):
+        """进程内用线程锁、进程间用 flock 互斥"""
+        with self._lock(category):
+            if fcntl is None:
+                yield
+                return
+            with open(self.cache_dir / f"{category}.lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _paths(self, category: str):
+        return self.cache_dir / f"{category}.zip", self.cache_dir / f"{category}.json"
+
+    @staticmethod
+    def _tmp_path(path: Path) -> Path:
+        """同目录下唯一的临时文件名，并发写入者之间互不覆盖"""
+        return path.with_name(f".{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+
+    @staticmethod
+    def _snapshot(entries) -> dict:
+        """记录每个文件的大小和修改时间，用于判断缓存是否仍然有效"""
+        snapshot = {}
+        for arcname, file_path in entries:
+            try:
+                st = Path(file_path).stat()
+            except FileNotFoundError:
+                continue
+            snapshot[arcname] = [str(file_path), st.st_size, st.st_mtime_ns]
+        return snapshot
+
+    @staticmethod
+    def _read_version(zip_path: Path) -> str:
+        """读取归档末尾 ZIP 注释中的版本号（32 位十六进制），不是本模块写入的归档返回 None"""
+        try:
+            with open(zip_path, "rb") as f:
+                f.seek(-(22 + 32), os.SEEK_END)
+                tail = f.read()
+        except OSError:
+            return None
+        if tail[:4] != b"PK\x05\x06" or int.from_bytes(tail[20:22], "little") != 32:
+            return None
+        return tail[22:].decode("ascii", "replace")
+
+    @staticmethod
+    def _write_entries(zipf: zipfile.ZipFile, snapshot: dict, arcnames):
+        for arcname in arcnames:
+            file_path = snapshot[arcname][0]
+            zipf.write(file_path, arcname, compress_type=compress_type_for(arcname))
+
+    def _replace(self, path: Path, write):
+        """write(tmp_path) 写入临时文件后原子替换 path，失败时删除临时文件"""
+        tmp_path = self._tmp_path(path)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    def _rebuild(self, category: str, zip_path: Path, snapshot: dict, readme: str, version: str):
+        """整体重建归档"""
+        def write(tmp_path):
+            with zipfile.ZipFile(tmp_path, "w") as zipf:
+                zipf.comment = version.encode("ascii")
+                zipf.writestr("README.txt", readme, compress_type=zipfile.ZIP_DEFLATED)
+                self._write_entries(zipf, snapshot, sorted(snapshot))
+
+        self._replace(zip_path, write)
+        logger.info("重建类别归档缓存: %s, 共 %s 个文件", category, len(snapshot))
+
+    def _append(self, category: str, zip_path: Path, snapshot: dict, new_arcnames, version: str) -> int:
+        """
+        原地追加新条目：新条目和新的中央目录写在文件末尾，旧的中央目录留在原处不再被引用
+        Returns:
+            本次留下的旧中央目录字节数
+        """
+        with zipfile.ZipFile(zip_path, "a") as zipf:
+            end = zipf.fp.seek(0, os.SEEK_END)
+            garbage = end - zipf.start_dir
+            zipf.start_dir = end
+            zipf.comment = version.encode("ascii")
+            self._write_entries(zipf, snapshot, new_arcnames)
+        logger.info("类别归档缓存追加 %s 个文件: %s", len(new_arcnames), category)
+        return garbage
+
+    @contextmanager
+    def acquire(self, category: str, entries, readme: str):
+        """
+        获取（必要时更新）类别归档
+        归档在锁内打开，返回的 file 只包含 etag 对应版本的字节，调用方负责关闭
+        Yields:
+            {"file", "size", "etag", "last_modified", "status"}，status 为 hit/append/rebuild
+        """
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        zip_path, state_path = self._paths(category)
+        snapshot = self._snapshot(entries)
+
+        with self._exclusive(category):
+            state = None
+            if zip_path.exists() and state_path.exists():
+                try:
+                    state = json.loads(state_path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    state = None
+
+            # 归档大小或版本号与记录不一致说明上次写入中断，需要重建
+            intact = state is not None and zip_path.stat().st_size == state.get("zip_size") \
+                and self._read_version(zip_path) == state.get("version")
+            cached = state["entries"] if intact else {}
+            garbage = state.get("garbage", 0) if intact else 0
+            new_arcnames = sorted(name for name in snapshot if name not in cached)
+
+            if not intact or any(snapshot.get(name) != value for name, value in cached.items()) \
+                    or garbage > state["zip_size"] * self.max_garbage_ratio:
+                version = uuid.uuid4().hex
+                self._rebuild(category, zip_path, snapshot, readme, version)
+                garbage = 0
+                status = "rebuild"
+            elif new_arcnames:
+                version = uuid.uuid4().hex
+                garbage += self._append(category, zip_path, snapshot, new_arcnames, version)
+                status = "append"
+            else:
+                version = state["version"]
+                status = "hit"
+
+            st = zip_path.stat()
+            if status != "hit":
+                state = json.dumps({
+                    "version": version,
+                    "zip_size": st.st_size,
+                    "garbage": garbage,
+                    "entries": snapshot
+                }, ensure_ascii=False)
+                self._replace(state_path, lambda tmp_path: tmp_path.write_text(state, encoding="utf-8"))
+
+            yield {
+                "file": SnapshotFile(zip_path, st.st_size),
+                "size": st.st_size,
+                "etag": version,
+                "last_modified": st.st_mtime,
+                "status": status
+            }
+
+    def invalidate(self, category: str = None):
+        """删除指定类别（或全部）的归档缓存"""
+        if not self.cache_dir.exists():
+            return
+        if category is None:
+            targets = list(self.cache_dir.glob("*.zip")) + list(self.cache_dir.glob("*.json"))
+            categories = {p.stem for p in targets}
+        else:
+            categories = {category}
+
+        for name in categories:
+            zip_path, state_path = self._paths(name)
+            with self._exclusive(name):
+                for path in (state_path, zip_path):
+                    try:
+                        path.unlink()
+                    except FileNotFoundError:
+                        pass
\ No newline at end of file
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+请求合并模块
+相同键的调用同时到达时只执行一次，其余调用等待并共享同一个结果，
+用于合并内容相同的并发推理请求
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """同一时刻每个键只有一个调用在执行"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        执行 fn()，如果相同键的调用正在执行则等待它完成并复用结果
+        Returns:
+            (结果, 是否复用了其他调用的结果)
+        Raises:
+            fn 抛出的异常，等待者会收到同一个异常
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # 先移除再唤醒，之后到达的相同请求会重新执行，不会拿到过期结果
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """正在执行的不同键的数量"""
+        with self._lock:
+            return len(self._calls)
\ No newline at end of file
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+检测结果导出模块
+把检测记录（records.py）流式导出为列式格式 (Parquet / Arrow IPC) 或标注格式 (COCO JSON / YOLO txt)；
+按块读取、按块输出，内存占用与检测框总数无关
+
+命令行:
+    python export.py --format parquet -o detections.parquet
+    python export.py --format coco --category food -o food_coco.json
+    python export.py --format yolo -o labels.tar.gz
+"""
+
+import io
+import json
+import time
+import tarfile
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+from archive import StreamBuffer, CHUNK_SIZE
+from records import iter_records
+
+logger = logging.getLogger(__name__)
+
+# 导出格式 -> (Content-Type, 扩展名)
+EXPORT_FORMATS = {
+    "jsonl": ("application/x-ndjson", ".jsonl"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", ".arrow"),
+    "coco": ("application/json", ".json"),
+    "yolo": ("application/gzip", ".tar.gz")
+}
+# 列式格式每个 RecordBatch / Row Group 的行数（检测框数）
+CHUNK_ROWS = 64 * 1024
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("Parquet/Arrow 导出需要 pyarrow，请先执行 pip install pyarrow")
+    return pyarrow
+
+
+def check_format(fmt: str):
+    """
+    检查导出格式是否可用，在开始输出之前调用
+    Raises:
+        ValueError: 不支持的格式
+        ImportError: 缺少 pyarrow
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}，支持: {', '.join(EXPORT_FORMATS)}")
+    if fmt in ("parquet", "arrow"):
+        _import_pyarrow()
+
+
+def _schema(pa):
+    """每个检测框一行"""
+    return pa.schema([
+        ("result_id", pa.string()),
+        ("category", pa.string()),
+        ("image", pa.string()),
+        ("time", pa.timestamp("ms")),
+        ("image_width", pa.int32()),
+        ("image_height", pa.int32()),
+        ("class_id", pa.int32()),
+        ("class_name", pa.string()),
+        ("confidence", pa.float32()),
+        ("x1", pa.float32()),
+        ("y1", pa.float32()),
+        ("x2", pa.float32()),
+        ("y2", pa.float32())
+    ])
+
+
+def iter_columnar(records, fmt: str, chunk_rows: int = CHUNK_ROWS):
+    """
+    导出为 Parquet 或 Arrow IPC 文件，每 chunk_rows 个检测框写一批
+    没有检测框的结果不产生行
+    Yields:
+        文件字节块
+    """
+    pa = _import_pyarrow()
+    schema = _schema(pa)
+    buf = StreamBuffer()
+    if fmt == "parquet":
+        writer = pa.parquet.ParquetWriter(buf, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(buf, schema)
+
+    columns = {name: [] for name in schema.names}
+
+    def flush():
+        writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=schema))
+        for values in columns.values():
+            values.clear()
+
+    for record in records:
+        for detection in record["detections"]:
+            x1, y1, x2, y2 = detection["bbox"] or (None, None, None, None)
+            row = {
+                "result_id": record["result_id"],
+                "category": record["category"],
+                "image": record["image"],
+                "time": int(record["time"] * 1000),
+                "image_width": record.get("image_width"),
+                "image_height": record.get("image_height"),
+                "class_id": detection["class_id"],
+                "class_name": detection["class_name"],
+                "confidence": detection["confidence"],
+                "x1": x1, "y1": y1, "x2": x2, "y2": y2
+            }
+            for name, value in row.items():
+                columns[name].append(value)
+
+            if len(columns["result_id"]) >= chunk_rows:
+                flush()
+                if buf.pending():
+                    yield buf.drain()
+
+    if columns["result_id"]:
+        flush()
+    writer.close()
+    yield buf.drain()
+
+
+def iter_coco(records):
+    """
+    导出为 COCO 检测格式 JSON
+    images 边读边输出，annotations 先写入临时文件，images 结束后再整体拼接；
+    category_id 使用模型的类别ID，每个标注额外带有 score
+    Yields:
+        JSON 字节块
+    """
+    categories = {}
+    out = bytearray(b'{"info": {"description": "YOLOv8 detections"}, "images": [')
+    image_id = annotation_id = 0
+
+    with tempfile.TemporaryFile() as annotations:
+        for record in records:
+            image_id += 1
+            image = {
+                "id": image_id,
+                "file_name": f"{record['category']}/{record['result_id']}_{record['image']}",
+                "width": record.get("image_width"),
+                "height": record.get("image_height"),
+                "result_id": record["result_id"]
+            }
+            out += (", " if image_id > 1 else "").encode() + json.dumps(image, ensure_ascii=False).encode("utf-8")
+
+            for detection in record["detections"]:
+                if not detection["bbox"]:
+                    continue
+                annotation_id += 1
+                categories[detection["class_id"]] = detection["class_name"]
+                x1, y1, x2, y2 = detection["bbox"]
+                w, h = round(x2 - x1, 2), round(y2 - y1, 2)
+                annotation = {
+                    "id": annotation_id,
+                    "image_id": image_id,
+                    "category_id": detection["class_id"],
+                    "bbox": [x1, y1, w, h],
+                    "area": round(w * h, 2),
+                    "iscrowd": 0,
+                    "score": detection["confidence"]
+                }
+                annotations.write((", " if annotation_id > 1 else "").encode() + json.dumps(annotation).encode())
+
+            if len(out) >= CHUNK_SIZE:
+                yield bytes(out)
+                out.clear()
+
+        out += b'], "annotations": ['
+        yield bytes(out)
+        out.clear()
+
+        annotations.seek(0)
+        while True:
+            chunk = annotations.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    category_list = [{"id": class_id, "name": name} for class_id, name in sorted(categories.items())]
+    yield b'], "categories": ' + json.dumps(category_list, ensure_ascii=False).encode("utf-8") + b"}"
+
+
+def iter_yolo(records):
+    """
+    导出为 YOLO txt 标注的 tar.gz 包
+    每张图像一个 labels/<类别>/<结果ID>_<文件名>.txt（与上传文件同名），每行 "类别ID cx cy w h"（归一化坐标）；
+    没有检测框的图像生成空文件，最后写入 classes.txt 列出类别ID对应的名称。
+    使用流式 tar 而不是 ZIP：ZIP 的中央目录要在内存中保留每个文件的条目，图像数很多时内存会持续增长
+    Yields:
+        tar.gz 字节块
+    """
+    classes = {}
+    buf = StreamBuffer()
+    now = time.time()
+
+    def add(tar, name: str, content: bytes):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        info.mtime = now
+        tar.addfile(info, io.BytesIO(content))
+
+    with tarfile.open(fileobj=buf, mode="w|gz") as tar:
+        for record in records:
+            width, height = record.get("image_width"), record.get("image_height")
+            if not width or not height:
+                continue
+            lines = []
+            for detection in record["detections"]:
+                if not detection["bbox"]:
+                    continue
+                classes[detection["class_id"]] = detection["class_name"]
+                x1, y1, x2, y2 = detection["bbox"]
+                lines.append(f"{detection['class_id']} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} "
+                             f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}\n")
+            stem = Path(record["image"]).stem
+            add(tar, f"labels/{record['category']}/{record['result_id']}_{stem}.txt", "".join(lines).encode())
+            if buf.pending() >= CHUNK_SIZE:
+                yield buf.drain()
+
+        names = [classes.get(i, "") for i in range(max(classes) + 1)] if classes else []
+        add(tar, "classes.txt", "".join(f"{name}\n" for name in names).encode("utf-8"))
+
+    yield buf.drain()
+
+
+def iter_jsonl(records):
+    """原样导出检测记录，每行一条结果"""
+    out = bytearray()
+    for record in records:
+        out += (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if len(out) >= CHUNK_SIZE:
+            yield bytes(out)
+            out.clear()
+    yield bytes(out)
+
+
+def iter_export(records, fmt: str, chunk_rows: int = CHUNK_ROWS):
+    """
+    按格式导出检测记录
+    Args:
+        records: 可迭代的检测记录，见 records.iter_records
+        fmt: EXPORT_FORMATS 中的格式
+        chunk_rows: 列式格式每批的行数
+    Yields:
+        字节块
+    """
+    check_format(fmt)
+    if fmt in ("parquet", "arrow"):
+        return iter_columnar(records, fmt, chunk_rows)
+    if fmt == "coco":
+        return iter_coco(records)
+    if fmt == "yolo":
+        return iter_yolo(records)
+    return iter_jsonl(records)
+
+
+def main():
+    """命令行主函数"""
+    parser = argparse.ArgumentParser(description="导出检测结果")
+    parser.add_argument("--root", default="runs/api_test", help="结果根目录")
+    parser.add_argument("-f", "--format", required=True, choices=list(EXPORT_FORMATS), help="导出格式")
+    parser.add_argument("-c", "--category", help="只导出指定类别")
+    parser.add_argument("-o", "--out", help="输出文件，默认 detections<扩展名>")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Parquet/Arrow 每批行数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    out = Path(args.out or f"detections{EXPORT_FORMATS[args.format][1]}")
+    stats = {"results": 0, "boxes": 0}
+
+    def counted(records):
+        for record in records:
+            stats["results"] += 1
+            stats["boxes"] += len(record["detections"])
+            yield record
+
+    try:
+        chunks = iter_export(counted(iter_records(Path(args.root), args.category)), args.format, args.chunk_rows)
+    except ImportError as e:
+        print(f"错误: {e}")
+        return 1
+
+    with open(out, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+    print(f"导出完成: {stats['results']} 条结果, {stats['boxes']} 个检测框 -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
\ No newline at end of file
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+图像快速校验模块
+只读取文件头中的格式标识和宽高，不解码像素；
+用于在写盘和推理之前拒绝非图像文件、扩展名与内容不符的文件以及像素数过大的解压炸弹
+"""
+
+import struct
+
+# 扩展名对应的图像格式
+EXTENSION_FORMATS = {
+    "jpg": "jpeg",
+    "jpeg": "jpeg",
+    "png": "png",
+    "bmp": "bmp",
+    "tiff": "tiff",
+    "tif": "tiff"
+}
+
+# JPEG 中携带图像尺寸的 SOF 标记（排除 DHT、JPG、DAC）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ImageProbeError(ValueError):
+    """文件不是可接受的图像"""
+
+
+def _probe_jpeg(data: bytes):
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ImageProbeError("JPEG 文件结构损坏")
+        marker = data[pos + 1]
+        # 填充字节
+        if marker == 0xFF:
+            pos += 1
+            continue
+        # 没有长度字段的独立标记
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):
+            break
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        if marker in _SOF_MARKERS:
+            if pos + 9 > len(data):
+                break
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    raise ImageProbeError("JPEG 文件中没有找到图像尺寸")
+
+
+def _probe_png(data: bytes):
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        raise ImageProbeError("PNG 文件头损坏")
+    return struct.unpack(">II", data[16:24])
+
+
+def _probe_bmp(data: bytes):
+    if len(data) < 26:
+        raise ImageProbeError("BMP 文件头损坏")
+    header_size = struct.unpack("<I", data[14:18])[0]
+    if header_size == 12:
+        width, height = struct.unpack("<HH", data[18:22])
+    else:
+        width, height = struct.unpack("<ii", data[18:26])
+    # 高度为负表示自上而下存储
+    return abs(width), abs(height)
+
+
+def _probe_tiff(data: bytes):
+    endian = "<" if data[:2] == b"II" else ">"
+    try:
+        offset = struct.unpack(endian + "I", data[4:8])[0]
+        count = struct.unpack(endian + "H", data[offset:offset + 2])[0]
+        size = {}
+        for i in range(count):
+            entry = data[offset + 2 + i * 12:offset + 14 + i * 12]
+            tag, field_type = struct.unpack(endian + "HH", entry[:4])
+            if tag in (256, 257):
+                # 3 = SHORT, 4 = LONG
+                fmt = "H" if field_type == 3 else "I"
+                size[tag] = struct.unpack(endian + fmt, entry[8:8 + struct.calcsize(fmt)])[0]
+            if len(size) == 2:
+                return size[256], size[257]
+    except struct.error:
+        pass
+    raise ImageProbeError("TIFF 文件中没有找到图像尺寸")
+
+
+def probe_image(data: bytes) -> dict:
+    """
+    识别图像格式并读取宽高
+    Returns:
+        {"format", "width", "height"}
+    Raises:
+        ImageProbeError: 不是支持的图像格式或文件头损坏
+    """
+    head = data[:16]
+    if head[:3] == b"\xff\xd8\xff":
+        fmt, probe = "jpeg", _probe_jpeg
+    elif head[:8] == b"\x89PNG\r\n\x1a\n":
+        fmt, probe = "png", _probe_png
+    elif head[:2] == b"BM":
+        fmt, probe = "bmp", _probe_bmp
+    elif head[:4] in (b"II*\x00", b"MM\x00*"):
+        fmt, probe = "tiff", _probe_tiff
+    else:
+        raise ImageProbeError("文件不是有效的图像文件")
+
+    try:
+        width, height = probe(data)
+    except struct.error:
+        raise ImageProbeError(f"{fmt.upper()} 文件头损坏")
+    return {"format": fmt, "width": width, "height": height}
+
+
+def validate_image(data: bytes, filename: str, max_pixels: int, max_dimension: int) -> dict:
+    """
+    校验上传的图像
+    Args:
+        data: 文件内容
+        filename: 文件名，用于检查扩展名与内容是否一致
+        max_pixels: 最大像素数，超过视为解压炸弹
+        max_dimension: 单边最大像素
+    Returns:
+        probe_image 的结果
+    Raises:
+        ImageProbeError: 校验失败
+    """
+    info = probe_image(data)
+
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    expected = EXTENSION_FORMATS.get(extension)
+    if expected != info["format"]:
+        raise ImageProbeError(f"文件扩展名 .{extension} 与实际内容 ({info['format']}) 不符")
+
+    width, height = info["width"], info["height"]
+    if width <= 0 or height <= 0:
+        raise ImageProbeError("图像尺寸无效")
+    if width > max_dimension or height > max_dimension:
+        raise ImageProbeError(f"图像尺寸 {width}x{height} 超过限制，单边最大 {max_dimension} 像素")
+    if width * height > max_pixels:
+        raise ImageProbeError(f"图像像素数 {width * height} 超过限制 {max_pixels}")
+
+    return info
\ No newline at end of file
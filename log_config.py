@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+日志配置模块
+请求线程只把日志记录放进队列，由单独的写线程负责格式化为 JSON 并写入按大小轮转的文件；
+INFO 级别日志可按请求采样，WARNING 及以上始终保留
+"""
+
+import json
+import time
+import zlib
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# 当前请求的ID，由 Flask 的 before_request 设置
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+_listener = None
+
+
+class RequestContextFilter(logging.Filter):
+    """给日志记录附加当前请求ID"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    INFO 及以下级别按比例采样
+    有请求ID时按请求ID决定是否采样，同一请求的日志要么全部保留要么全部丢弃
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > logging.INFO:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            return (zlib.crc32(request_id.encode("utf-8")) % 10000) < self.rate * 10000
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName
+        }
+        # 通过 extra 传入的结构化字段，如耗时、状态码
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    入队时不做格式化，只把参数转成字符串快照，真正的格式化留给写线程
+    （默认的 QueueHandler 会在调用线程里完成格式化）
+    """
+
+    def prepare(self, record):
+        if record.args:
+            record.args = tuple(a if isinstance(a, (int, float, str)) else str(a) for a in record.args) \
+                if isinstance(record.args, tuple) else record.args
+        if record.exc_info:
+            # 异常对象不能安全地跨线程保留，这里先格式化
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(log_file: str = "app.log",
+                  level: int = logging.INFO,
+                  max_bytes: int = 50 * 1024 * 1024,
+                  backup_count: int = 5,
+                  sample_rate: float = 1.0,
+                  console: bool = True):
+    """
+    配置异步日志
+    Args:
+        log_file: 日志文件路径，按大小轮转
+        level: 日志级别
+        max_bytes: 单个日志文件的最大字节数
+        backup_count: 保留的历史日志文件数
+        sample_rate: INFO 日志的采样比例（0~1）
+        console: 是否同时输出到控制台
+    Returns:
+        QueueListener 写线程
+    """
+    global _listener
+    stop_logging()
+
+    log_queue = queue.SimpleQueue()
+
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(stream_handler)
+
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """停止写线程，队列中剩余的日志会先写完"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
\ No newline at end of file
@@ -7,19 +7,44 @@ YOLOv8 推理模块
 import argparse
 from pathlib import Path
 import cv2
+import numpy as np
 import time
 import threading
 import logging
 from ultralytics import YOLO
 
+import metrics
+from image_probe import probe_image, ImageProbeError
+
 # 全局模型实例和锁
 _model = None
 _model_lock = threading.Lock()
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 模型输入尺寸，YOLO 会把长边缩放到这个尺寸
+MODEL_INPUT_SIZE = 640
+# JPEG 按 1/2、1/4、1/8 降采样解码（DCT 缩放），解码后长边仍不小于模型输入尺寸
+_REDUCED_DECODE_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# 可视化图像格式 -> 扩展名，original 表示沿用原图格式
+VIS_FORMATS = {
+    "original": None,
+    "jpeg": ".jpg",
+    "webp": ".webp",
+    "png": ".png"
+}
+
+# 推理各阶段耗时指标
+INFERENCE_STAGE_SECONDS = metrics.histogram(
+    "yolo_inference_stage_seconds", "run_inference 各阶段耗时（秒）", ["stage"])
+INFERENCE_TOTAL = metrics.counter(
+    "yolo_inference_total", "推理次数", ["status"])
+MODEL_LOAD_SECONDS = metrics.gauge(
+    "yolo_model_load_seconds", "模型加载耗时（秒）")
+
 
 def load_model(weights: Path = Path("weights/yolov8n.pt")):
     """
@@ -37,143 +62,457 @@ def load_model(weights: Path = Path("weights/yolov8n.pt")):
                 if not weights.exists():
                     raise FileNotFoundError(f"模型权重文件不存在: {weights}")
 
-                logger.info(f"正在加载模型: {weights}")
+                logger.info("正在加载模型: %s", weights)
+                load_start = time.perf_counter()
                 _model = YOLO(str(weights))
+                MODEL_LOAD_SECONDS.set(value=time.perf_counter() - load_start)
                 logger.info("模型加载成功")
 
             except Exception as e:
-                logger.error(f"模型加载失败: {str(e)}")
+                logger.error("模型加载失败: %s", e)
                 raise
 
     return _model
 
 
+def warmup_model(weights: Path = Path("weights/yolov8n.pt"), imgsz: int = MODEL_INPUT_SIZE):
+    """
+    加载模型并用空白图像推理一次
+    首次推理会完成权重融合、算子初始化等一次性工作，在 fork 前执行可让工作进程直接共享这些内存
+    Args:
+        weights: 模型权重文件路径
+        imgsz: 预热图像尺寸
+    Returns:
+        预热耗时（秒）
+    """
+    model = load_model(weights)
+    start = time.perf_counter()
+    model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False)
+    elapsed = time.perf_counter() - start
+    logger.info("模型预热完成，耗时 %.3fs", elapsed)
+    return elapsed
+
+
+def decode_image(img_path: Path, target_size: int = MODEL_INPUT_SIZE, image_data: bytes = None):
+    """
+    解码图像，远大于模型输入尺寸的 JPEG 直接按比例降采样解码，减少解码耗时和内存
+    Args:
+        img_path: 图像路径
+        target_size: 解码后长边的最小值
+        image_data: 已在内存中的图像内容，提供时不再读取文件
+    Returns:
+        (BGR 图像, 降采样倍数, 原图 (宽, 高))
+    """
+    if image_data is not None:
+        data = np.frombuffer(image_data, dtype=np.uint8)
+    else:
+        data = np.fromfile(str(img_path), dtype=np.uint8)
+    try:
+        info = probe_image(image_data if image_data is not None else data.tobytes())
+        width, height = info["width"], info["height"]
+        is_jpeg = info["format"] == "jpeg"
+    except ImageProbeError:
+        width = height = None
+        is_jpeg = False
+
+    scale, flag = 1, cv2.IMREAD_COLOR
+    if is_jpeg:
+        for factor, reduced_flag in _REDUCED_DECODE_FLAGS:
+            if max(width, height) / factor >= target_size:
+                scale, flag = factor, reduced_flag
+                break
+
+    img = cv2.imdecode(data, flag)
+    if img is None:
+        raise RuntimeError(f"无法解码图像: {img_path}")
+
+    if scale == 1 or width is None:
+        return img, 1, (img.shape[1], img.shape[0])
+
+    # 解码时会按 EXIF 方向旋转，此时原图宽高与文件头中的相反
+    if -(-width // scale) != img.shape[1] and -(-height // scale) == img.shape[1]:
+        width, height = height, width
+    return img, scale, (width, height)
+
+
+def _plot(result, line_width: int = None):
+    """生成可视化图像，line_width 为空时由 ultralytics 按图像尺寸自动选择线宽"""
+    annotated_img = result.plot(line_width=line_width or None)
+    if annotated_img is None:
+        raise RuntimeError("无法生成可视化图像")
+    return annotated_img
+
+
+def vis_suffix(img_path: Path, vis_format: str = "original") -> str:
+    """
+    可视化图像的扩展名
+    Raises:
+        ValueError: 不支持的格式
+    """
+    if vis_format not in VIS_FORMATS:
+        raise ValueError(f"不支持的可视化格式: {vis_format}，支持: {', '.join(VIS_FORMATS)}")
+    return VIS_FORMATS[vis_format] or img_path.suffix.lower()
+
+
+def encode_visualization(annotated_img, suffix: str, quality: int = None, max_dim: int = None) -> bytes:
+    """
+    在内存中把可视化图像编码为 suffix 对应的格式
+    Args:
+        annotated_img: 可视化图像
+        suffix: 扩展名，决定编码格式
+        quality: JPEG/WebP 质量（1-100），为空时使用 OpenCV 默认值
+        max_dim: 长边超过该尺寸时先缩小，为空或 0 表示不缩小
+    """
+    if max_dim:
+        h, w = annotated_img.shape[:2]
+        scale = max_dim / max(h, w)
+        if scale < 1:
+            annotated_img = cv2.resize(annotated_img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                       interpolation=cv2.INTER_AREA)
+
+    params = []
+    if quality:
+        if suffix in (".jpg", ".jpeg"):
+            params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+        elif suffix == ".webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+
+    success, encoded = cv2.imencode(suffix, annotated_img, params)
+    if not success:
+        raise RuntimeError(f"编码可视化图像失败: {suffix}")
+    return encoded.tobytes()
+
+
+def _render_visualization(result, img_path: Path, vis_format: str, vis_quality: int,
+                          vis_max_dim: int, vis_line_width: int, stage_times: dict):
+    """
+    绘制并编码可视化图像，绘制和编码耗时记入 stage_times
+    Returns:
+        (编码后的内容, 扩展名)
+    """
+    suffix = vis_suffix(img_path, vis_format)
+
+    stage_start = time.perf_counter()
+    annotated_img = _plot(result, vis_line_width)
+    stage_times["plot"] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    encoded = encode_visualization(annotated_img, suffix, vis_quality, vis_max_dim)
+    stage_times["encode_vis"] = time.perf_counter() - stage_start
+    return encoded, suffix
+
+
+def _vis_info(encoded: bytes, suffix: str, stage_times: dict) -> dict:
+    """结果中与可视化图像编码相关的字段"""
+    if encoded is None:
+        return {}
+    return {
+        "vis_format": suffix.lstrip("."),
+        "vis_bytes": len(encoded),
+        "vis_encode_ms": round(stage_times.get("encode_vis", 0) * 1000, 2)
+    }
+
+
+def _save_visualization(encoded: bytes, suffix: str, img_path: Path, save_dir: Path, result_id: str = None) -> Path:
+    """保存已编码的可视化图像，返回保存路径；suffix 为编码格式的扩展名"""
+    if result_id:
+        vis_filename = f"vis_{result_id}{suffix}"
+    else:
+        vis_filename = f"vis_{img_path.stem}_{int(time.time())}{suffix}"
+    vis_path = save_dir / vis_filename
+
+    try:
+        vis_path.write_bytes(encoded)
+    except OSError as e:
+        raise RuntimeError(f"保存可视化图像失败: {vis_path}: {e}")
+
+    logger.info("可视化图像保存成功: %s", vis_path)
+    return vis_path
+
+
+def _parse_detections(result, names: dict, scale_x: float = 1.0, scale_y: float = 1.0):
+    """
+    解析检测结果，检测框换算回原图坐标
+    Returns:
+        (全部检测结果, 置信度最高的检测结果)
+    """
+    detections = []
+    best_detection = None
+
+    def to_original(box):
+        if box is None:
+            return None
+        x1, y1, x2, y2 = box.tolist()
+        return [x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y]
+
+    if result.boxes is not None and len(result.boxes.conf) > 0:
+        # 获取所有检测结果
+        for i in range(len(result.boxes.conf)):
+            detection = {
+                "class_id": int(result.boxes.cls[i]),
+                "class_name": names[int(result.boxes.cls[i])],
+                "confidence": float(result.boxes.conf[i]),
+                "bbox": to_original(result.boxes.xyxy[i]) if result.boxes.xyxy is not None else None
+            }
+            detections.append(detection)
+
+        # 获取置信度最高的检测结果
+        best_idx = result.boxes.conf.argmax()
+        best_detection = {
+            "class_id": int(result.boxes.cls[best_idx]),
+            "class_name": names[int(result.boxes.cls[best_idx])],
+            "confidence": float(result.boxes.conf[best_idx]),
+            "bbox": to_original(result.boxes.xyxy[best_idx]) if result.boxes.xyxy is not None else None
+        }
+
+    return detections, best_detection
+
+
+def _success_result(img_path: Path, weights: Path, result_id: str, vis_path, size: tuple, decode_scale: int,
+                    inference_time: float, stage_times: dict, detections: list, best_detection,
+                    vis_info: dict = None) -> dict:
+    """构建成功的推理结果"""
+    inference_result = {
+        "result_id": result_id,
+        "image": img_path.name,
+        "image_path": str(img_path),
+        "vis_path": str(vis_path) if vis_path else None,
+        "image_width": size[0],
+        "image_height": size[1],
+        "decode_scale": decode_scale,
+        "inference_time_seconds": round(inference_time, 3),
+        "stage_times_ms": {stage: round(t * 1000, 2) for stage, t in stage_times.items()},
+        "model_name": str(weights.name),
+        "detection_count": len(detections),
+        "detections": detections,
+        "best_detection": best_detection,
+        "success": True
+    }
+    inference_result.update(vis_info or {})
+
+    # 兼容原有接口格式
+    if best_detection:
+        inference_result.update({
+            "class_id": best_detection["class_id"],
+            "score": best_detection["confidence"]
+        })
+    else:
+        inference_result.update({
+            "class_id": None,
+            "score": None
+        })
+
+    INFERENCE_TOTAL.inc("success")
+    logger.info("推理完成: %s, 耗时: %.3fs, 检测到 %s 个对象", img_path.name, inference_time, len(detections),
+                extra={"inference_ms": round(inference_time * 1000, 2),
+                       "stage_times_ms": inference_result["stage_times_ms"]})
+    return inference_result
+
+
+def _failure_result(img_path: Path, weights: Path, result_id: str, error: Exception) -> dict:
+    """构建失败的推理结果"""
+    INFERENCE_TOTAL.inc("error")
+    logger.error("推理失败: %s", error)
+    return {
+        "result_id": result_id,
+        "image": img_path.name if img_path else "unknown",
+        "image_path": str(img_path) if img_path else None,
+        "vis_path": None,
+        "inference_time_seconds": 0,
+        "model_name": str(weights.name) if weights else "unknown",
+        "detection_count": 0,
+        "detections": [],
+        "best_detection": None,
+        "success": False,
+        "error": str(error),
+        "class_id": None,
+        "score": None
+    }
+
+
 def run_inference(img_path: Path,
                   weights: Path = Path("weights/yolov8n.pt"),
-                  save_dir: Path = Path("runs/local_test")) -> dict:
+                  save_dir: Path = Path("runs/local_test"),
+                  result_id: str = None,
+                  image_data: bytes = None,
+                  save_vis: bool = True,
+                  return_vis: bool = False,
+                  vis_format: str = "original",
+                  vis_quality: int = None,
+                  vis_max_dim: int = None,
+                  vis_line_width: int = None) -> dict:
     """
     执行目标检测推理
     Args:
         img_path: 输入图像路径
         weights: 模型权重文件路径
         save_dir: 结果保存目录
+        result_id: 结果ID，提供时可视化文件命名为 vis_<结果ID><后缀>，便于与原图配对
+        image_data: 已在内存中的图像内容，提供时直接解码，不再从 img_path 读取
+        save_vis: 是否把可视化图像写入 save_dir
+        return_vis: 是否在结果的 vis_image 字段中返回编码后的可视化图像内容（bytes）
+        vis_format: 可视化图像格式，见 VIS_FORMATS
+        vis_quality: 可视化图像的 JPEG/WebP 质量
+        vis_max_dim: 可视化图像长边上限
+        vis_line_width: 检测框线宽
     Returns:
         推理结果字典
     """
     try:
         # 检查输入文件
-        if not img_path.exists():
+        if image_data is None and not img_path.exists():
             raise FileNotFoundError(f"输入图像不存在: {img_path}")
 
         # 创建保存目录
-        save_dir.mkdir(parents=True, exist_ok=True)
+        if save_vis:
+            save_dir.mkdir(parents=True, exist_ok=True)
 
         # 记录开始时间
         start_time = time.time()
 
+        # 各阶段耗时（秒）
+        stage_times = {}
+        stage_start = time.perf_counter()
+
+        def mark(stage):
+            nonlocal stage_start
+            now = time.perf_counter()
+            stage_times[stage] = now - stage_start
+            INFERENCE_STAGE_SECONDS.observe(stage, value=stage_times[stage])
+            stage_start = now
+
         # 加载模型
         model = load_model(weights)
+        mark("load_model")
+
+        # 解码图像，大图降采样解码，检测框之后换算回原图坐标
+        img, decode_scale, size = decode_image(img_path, image_data=image_data)
+        mark("decode")
 
         # 执行推理
-        logger.info(f"开始推理: {img_path.name}")
-        results = model(str(img_path))
+        logger.info("开始推理: %s", img_path.name)
+        results = model(img)
+        mark("predict")
 
         if not results:
             raise RuntimeError("推理返回空结果")
 
         result = results[0]
 
-        # 生成可视化图像
-        try:
-            annotated_img = result.plot()
-            if annotated_img is None:
-                raise RuntimeError("无法生成可视化图像")
-
-            # 保存可视化结果
-            vis_filename = f"vis_{img_path.stem}_{int(time.time())}{img_path.suffix}"
-            vis_path = save_dir / vis_filename
+        # 生成可视化图像，只编码一次，按需写盘和/或随结果返回
+        vis_path = vis_image = suffix = None
+        if save_vis or return_vis:
+            try:
+                vis_image, suffix = _render_visualization(result, img_path, vis_format, vis_quality,
+                                                          vis_max_dim, vis_line_width, stage_times)
+                for stage in ("plot", "encode_vis"):
+                    INFERENCE_STAGE_SECONDS.observe(stage, value=stage_times[stage])
+                stage_start = time.perf_counter()
+                if save_vis:
+                    vis_path = _save_visualization(vis_image, suffix, img_path, save_dir, result_id)
+                    mark("save_vis")
+            except Exception as e:
+                logger.error("生成可视化图像失败: %s", e)
 
-            success = cv2.imwrite(str(vis_path), annotated_img)
-            if not success:
-                raise RuntimeError(f"保存可视化图像失败: {vis_path}")
+        # 解析检测结果
+        detections, best_detection = _parse_detections(
+            result, model.names, size[0] / img.shape[1], size[1] / img.shape[0])
+        mark("parse")
+
+        inference_result = _success_result(img_path, weights, result_id, vis_path, size, decode_scale,
+                                           time.time() - start_time, stage_times, detections, best_detection,
+                                           _vis_info(vis_image, suffix, stage_times))
+        if return_vis:
+            inference_result["vis_image"] = vis_image
+        return inference_result
 
-            logger.info(f"可视化图像保存成功: {vis_path}")
+    except Exception as e:
+        return _failure_result(img_path, weights, result_id, e)
 
-        except Exception as e:
-            logger.error(f"生成可视化图像失败: {str(e)}")
-            vis_path = None
 
-        # 解析检测结果
-        detections = []
-        best_detection = None
-
-        if result.boxes is not None and len(result.boxes.conf) > 0:
-            # 获取所有检测结果
-            for i in range(len(result.boxes.conf)):
-                detection = {
-                    "class_id": int(result.boxes.cls[i]),
-                    "class_name": model.names[int(result.boxes.cls[i])],
-                    "confidence": float(result.boxes.conf[i]),
-                    "bbox": result.boxes.xyxy[i].tolist() if result.boxes.xyxy is not None else None
-                }
-                detections.append(detection)
-
-            # 获取置信度最高的检测结果
-            best_idx = result.boxes.conf.argmax()
-            best_detection = {
-                "class_id": int(result.boxes.cls[best_idx]),
-                "class_name": model.names[int(result.boxes.cls[best_idx])],
-                "confidence": float(result.boxes.conf[best_idx]),
-                "bbox": result.boxes.xyxy[best_idx].tolist() if result.boxes.xyxy is not None else None
-            }
+def run_inference_batch(items: list,
+                        weights: Path = Path("weights/yolov8n.pt"),
+                        batch_size: int = 8,
+                        vis_format: str = "original",
+                        vis_quality: int = None,
+                        vis_max_dim: int = None,
+                        vis_line_width: int = None) -> list:
+    """
+    批量推理，每 batch_size 张图像一起送入模型，摊薄每次前向推理的固定开销
+    Args:
+        items: [(图像路径, 可视化保存目录, 结果ID)]
+        weights: 模型权重文件路径
+        batch_size: 每批图像数
+        vis_format, vis_quality, vis_max_dim, vis_line_width: 可视化图像编码选项，同 run_inference
+    Returns:
+        与输入顺序一致的推理结果列表，单张失败不影响同批其他图像
+    """
+    outputs = [None] * len(items)
+    try:
+        model = load_model(weights)
+    except Exception as e:
+        return [_failure_result(img_path, weights, result_id, e) for img_path, _, result_id in items]
 
-        # 计算推理时间
-        inference_time = time.time() - start_time
-
-        # 构建返回结果
-        inference_result = {
-            "image": img_path.name,
-            "image_path": str(img_path),
-            "vis_path": str(vis_path) if vis_path else None,
-            "inference_time_seconds": round(inference_time, 3),
-            "model_name": str(weights.name),
-            "detection_count": len(detections),
-            "detections": detections,
-            "best_detection": best_detection,
-            "success": True
-        }
+    for batch_start in range(0, len(items), batch_size):
+        batch = []
+        for index in range(batch_start, min(batch_start + batch_size, len(items))):
+            img_path, save_dir, result_id = items[index]
+            decode_start = time.perf_counter()
+            try:
+                img, decode_scale, size = decode_image(img_path)
+            except Exception as e:
+                outputs[index] = _failure_result(img_path, weights, result_id, e)
+                continue
+            decode_time = time.perf_counter() - decode_start
+            INFERENCE_STAGE_SECONDS.observe("decode", value=decode_time)
+            batch.append((index, img, decode_scale, size, decode_time))
 
-        # 兼容原有接口格式
-        if best_detection:
-            inference_result.update({
-                "class_id": best_detection["class_id"],
-                "score": best_detection["confidence"]
-            })
-        else:
-            inference_result.update({
-                "class_id": None,
-                "score": None
-            })
+        if not batch:
+            continue
 
-        logger.info(f"推理完成: {img_path.name}, 耗时: {inference_time:.3f}s, 检测到 {len(detections)} 个对象")
-        return inference_result
+        predict_start = time.perf_counter()
+        try:
+            results = model([img for _, img, _, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError("推理返回结果数量与输入不一致")
+        except Exception as e:
+            for index, *_ in batch:
+                img_path, _, result_id = items[index]
+                outputs[index] = _failure_result(img_path, weights, result_id, e)
+            continue
+        # 批量推理的耗时按图像数平摊
+        predict_time = (time.perf_counter() - predict_start) / len(batch)
+        INFERENCE_STAGE_SECONDS.observe("predict", value=predict_time)
+
+        for (index, img, decode_scale, size, decode_time), result in zip(batch, results):
+            img_path, save_dir, result_id = items[index]
+            stage_times = {"decode": decode_time, "predict": predict_time}
+            try:
+                vis_image = suffix = None
+                try:
+                    save_dir.mkdir(parents=True, exist_ok=True)
+                    vis_image, suffix = _render_visualization(result, img_path, vis_format, vis_quality,
+                                                              vis_max_dim, vis_line_width, stage_times)
+                    for stage in ("plot", "encode_vis"):
+                        INFERENCE_STAGE_SECONDS.observe(stage, value=stage_times[stage])
+                    stage_start = time.perf_counter()
+                    vis_path = _save_visualization(vis_image, suffix, img_path, save_dir, result_id)
+                    stage_times["save_vis"] = time.perf_counter() - stage_start
+                    INFERENCE_STAGE_SECONDS.observe("save_vis", value=stage_times["save_vis"])
+                except Exception as e:
+                    logger.error("生成可视化图像失败: %s", e)
+                    vis_path = None
+
+                detections, best_detection = _parse_detections(
+                    result, model.names, size[0] / img.shape[1], size[1] / img.shape[0])
+                outputs[index] = _success_result(img_path, weights, result_id, vis_path, size, decode_scale,
+                                                 sum(stage_times.values()), stage_times,
+                                                 detections, best_detection,
+                                                 _vis_info(vis_image, suffix, stage_times))
+            except Exception as e:
+                outputs[index] = _failure_result(img_path, weights, result_id, e)
 
-    except Exception as e:
-        logger.error(f"推理失败: {str(e)}")
-        return {
-            "image": img_path.name if img_path else "unknown",
-            "image_path": str(img_path) if img_path else None,
-            "vis_path": None,
-            "inference_time_seconds": 0,
-            "model_name": str(weights.name) if weights else "unknown",
-            "detection_count": 0,
-            "detections": [],
-            "best_detection": None,
-            "success": False,
-            "error": str(e),
-            "class_id": None,
-            "score": None
-        }
+    return outputs
 
 
 def main():
@@ -185,9 +524,8 @@ def main():
     parser.add_argument("-v", "--verbose", action="store_true", help="详细输出")
     args = parser.parse_args()
 
-    # 设置日志级别
-    if args.verbose:
-        logging.getLogger().setLevel(logging.DEBUG)
+    # 设置日志级别（作为模块导入时由调用方配置日志）
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
 
     try:
         # 检查输入参数
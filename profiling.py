@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+性能剖析模块
+- 按需剖析单个请求：用 cProfile 记录请求处理线程的完整调用（包括 run_inference），
+  结果保存为 .prof 文件，可下载后用 snakeviz / pstats 查看
+- 常驻采样剖析：后台线程定时采集正在处理请求的线程的调用栈，跨请求累计，
+  输出 flamegraph.pl / speedscope 可直接使用的 collapsed stacks 格式
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from pathlib import Path
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# 采样得到的不同调用栈数量上限，超出后新的调用栈计入 [other]
+MAX_STACKS = 20000
+# 单个调用栈最多保留的帧数（从最外层开始）
+MAX_DEPTH = 128
+
+
+class RequestProfiler:
+    """
+    单个请求的确定性剖析
+    cProfile 开销较大，同一时刻只剖析一个请求，其余请求照常处理、不剖析
+    """
+
+    def __init__(self, profile_dir: Path, keep: int = 50):
+        """
+        Args:
+            profile_dir: .prof 文件保存目录
+            keep: 最多保留的剖析结果数，超出时删除最旧的
+        """
+        self.profile_dir = Path(profile_dir)
+        self.keep = keep
+        self._busy = threading.Lock()
+
+    def start(self):
+        """
+        开始剖析当前线程
+        Returns:
+            cProfile.Profile，已有请求正在剖析时返回 None
+        """
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 其他剖析工具已在运行
+            self._busy.release()
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, profile_id: str = None, meta: dict = None) -> str:
+        """
+        结束剖析并保存结果
+        Args:
+            profile: start 返回的对象
+            profile_id: 结果ID，为空时不保存（请求异常中断时只需释放）
+            meta: 随结果保存的请求信息（方法、路径、状态码、耗时等）
+        Returns:
+            结果ID
+        """
+        try:
+            profile.disable()
+        finally:
+            self._busy.release()
+        if not profile_id:
+            return None
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(str(self.profile_dir / f"{profile_id}.prof"))
+        meta = dict(meta or {}, profile_id=profile_id, created=time.strftime('%Y-%m-%d %H:%M:%S'))
+        (self.profile_dir / f"{profile_id}.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        profiles = sorted(self.profile_dir.glob("*.prof"), key=lambda p: p.stat().st_mtime)
+        for path in profiles[:max(0, len(profiles) - self.keep)]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".json").unlink(missing_ok=True)
+
+    def path(self, profile_id: str) -> Path:
+        """结果文件路径，不存在时返回 None"""
+        path = self.profile_dir / f"{Path(profile_id).name}.prof"
+        return path if path.exists() else None
+
+    def profiles(self) -> list:
+        """已保存的剖析结果，最新的在前"""
+        if not self.profile_dir.exists():
+            return []
+        items = []
+        for path in sorted(self.profile_dir.glob("*.prof"), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                meta = json.loads(path.with_suffix(".json").read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                meta = {"profile_id": path.stem}
+            meta["size"] = path.stat().st_size
+            items.append(meta)
+        return items
+
+    def report(self, profile_id: str, sort: str = "cumulative", limit: int = 50) -> str:
+        """pstats 文本报告"""
+        out = io.StringIO()
+        stats = pstats.Stats(str(self.path(profile_id)), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    """
+    低开销的采样剖析
+    每隔 interval 秒读取一次被跟踪线程的当前调用栈并计数，不影响被采样线程的执行；
+    只跟踪正在处理请求的线程（由 track/untrack 登记），空闲的服务线程不计入
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """
+        Args:
+            interval: 采样间隔（秒）
+        """
+        self.interval = interval
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._samples = 0
+        self._started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = None):
+        """启动采样线程"""
+        if interval:
+            self.interval = interval
+        if self.running:
+            return
+        self._stop.clear()
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info("采样剖析已启动: 间隔 %gms", self.interval * 1000)
+
+    def stop(self, timeout: float = 5):
+        """停止采样线程，已采集的调用栈保留"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def track(self):
+        """登记当前线程，开始采样它的调用栈"""
+        with self._lock:
+            self._threads.add(threading.get_ident())
+
+    def untrack(self):
+        """取消登记当前线程"""
+        with self._lock:
+            self._threads.discard(threading.get_ident())
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error("采样调用栈失败: %s", e)
+
+    def _sample(self):
+        with self._lock:
+            threads = set(self._threads)
+        if not threads:
+            return
+
+        frames = sys._current_frames()
+        for ident in threads:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            # collapsed stacks 由外到内排列
+            stack = ";".join(reversed(names[-MAX_DEPTH:]))
+            with self._lock:
+                if stack not in self._stacks and len(self._stacks) >= MAX_STACKS:
+                    stack = "[other]"
+                self._stacks[stack] += 1
+                self._samples += 1
+
+    def collapsed(self) -> str:
+        """collapsed stacks 文本，每行 "帧1;帧2;帧3 次数" """
+        with self._lock:
+            items = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def reset(self):
+        """清空已采集的调用栈"""
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+        self._started_at = time.time() if self.running else None
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "running": self.running,
+                "interval_ms": round(self.interval * 1000, 3),
+                "samples": self._samples,
+                "stacks": len(self._stacks),
+                "tracked_threads": len(self._threads),
+                "since": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started_at))
+                if self._started_at else None,
+                "pid": os.getpid()
+            }
\ No newline at end of file
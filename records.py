@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+检测记录模块
+每条成功的推理结果以一行 JSON 追加到 <结果根目录>/records/<类别>/<日期>.jsonl，
+只保存检测结果本身，不含图像；供批量导出和统计使用，读取时逐行流式处理
+"""
+
+import os
+import json
+import time
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+RECORDS_DIR = "records"
+
+
+def build_record(category: str, result: dict, upload_bytes: int = None) -> dict:
+    """从推理结果中提取需要长期保存的字段，upload_bytes 为上传文件大小"""
+    detections = []
+    for detection in result.get("detections") or []:
+        bbox = detection.get("bbox")
+        detections.append({
+            "class_id": detection["class_id"],
+            "class_name": detection["class_name"],
+            "confidence": round(detection["confidence"], 4),
+            "bbox": [round(v, 2) for v in bbox] if bbox else None
+        })
+    return {
+        "result_id": result["result_id"],
+        "category": category,
+        "image": result.get("original_filename") or result.get("image"),
+        "image_width": result.get("image_width"),
+        "image_height": result.get("image_height"),
+        "model_name": result.get("model_name"),
+        "upload_bytes": upload_bytes,
+        "deduplicated": result.get("deduplicated", False),
+        "vis_bytes": result.get("vis_bytes") if result.get("vis_path") else 0,
+        "time": round(time.time(), 3),
+        "detections": detections
+    }
+
+
+def append_record(save_root: Path, category: str, result: dict, upload_bytes: int = None) -> Path:
+    """
+    追加一条检测记录
+    整行一次 write 写入 O_APPEND 文件，多个进程同时追加时行之间不会交错
+    Returns:
+        记录文件路径
+    """
+    line = json.dumps(build_record(category, result, upload_bytes), ensure_ascii=False, separators=(",", ":")) + "\n"
+    path = Path(save_root) / RECORDS_DIR / category / f"{time.strftime('%Y-%m-%d')}.jsonl"
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode("utf-8"))
+    finally:
+        os.close(fd)
+    return path
+
+
+def record_files(save_root: Path, category: str = None) -> list:
+    """按类别、日期排序的记录文件列表"""
+    records_dir = Path(save_root) / RECORDS_DIR
+    if not records_dir.exists():
+        return []
+    if category:
+        categories = [records_dir / category]
+    else:
+        categories = sorted(d for d in records_dir.iterdir() if d.is_dir())
+    return [path for cat_dir in categories if cat_dir.is_dir() for path in sorted(cat_dir.glob("*.jsonl"))]
+
+
+def iter_records(save_root: Path, category: str = None):
+    """
+    逐条读取检测记录，内存占用与记录总数无关
+    末尾不完整的行（写入中途进程退出）和无法解析的行会被跳过
+    Yields:
+        记录字典
+    """
+    for path in record_files(save_root, category):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.endswith("\n"):
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning("跳过无法解析的检测记录: %s:%s", path, line_no)
+        except FileNotFoundError:
+            # 读取期间类别被清理
+            continue
\ No newline at end of file
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+结果保留策略模块
+后台线程按最长保存时间、类别配额和全局配额淘汰最早的上传文件和可视化文件。
+文件的时间取自文件名中的结果ID：上传文件是 blob 的硬链接，内容重复时 mtime 是第一次上传的时间，
+atime 又会被下载、打包等读取操作刷新，都不能代表结果的生成时间
+"""
+
+import os
+import time
+import heapq
+import logging
+import threading
+from pathlib import Path
+
+from storage import result_key, result_time
+
+logger = logging.getLogger(__name__)
+
+# 参与淘汰的结果子目录
+RESULT_KINDS = ("uploads", "visualizations")
+
+
+class RetentionManager:
+    """
+    后台保留策略管理器
+    每轮最多淘汰 batch_size 个文件，类别之间短暂让出 CPU，
+    还有未完成的淘汰工作时下一轮会很快开始，不会在一次扫描中长时间占用资源
+    """
+
+    def __init__(self, save_root: Path,
+                 max_age_days: float = 0,
+                 category_quota_bytes: int = 0,
+                 global_quota_bytes: int = 0,
+                 category_quotas: dict = None,
+                 interval: float = 300,
+                 batch_size: int = 500,
+                 pause: float = 0.05,
+                 on_evict=None,
+                 on_cycle=None):
+        """
+        Args:
+            save_root: 结果根目录
+            max_age_days: 最长保存天数，0 表示不限制
+            category_quota_bytes: 每个类别的默认配额，0 表示不限制
+            global_quota_bytes: 全部结果的总配额，0 表示不限制
+            category_quotas: 个别类别的配额覆盖 {类别: 字节数}
+            interval: 两轮检查之间的间隔（秒）
+            batch_size: 每轮每类最多淘汰的文件数
+            pause: 扫描完一个类别后的让出时间（秒）
+            on_evict: 删除文件后的回调 on_evict(kind, category, path)，用于同步缓存/索引
+            on_cycle: 每轮结束后的回调，如回收孤立 blob
+        """
+        self.save_root = Path(save_root)
+        self.max_age = max_age_days * 86400
+        self.category_quota = category_quota_bytes
+        self.global_quota = global_quota_bytes
+        self.category_quotas = category_quotas or {}
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.on_evict = on_evict
+        self.on_cycle = on_cycle
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {
+            "running": False,
+            "last_run": None,
+            "last_duration_seconds": None,
+            "evicted_files": 0,
+            "evicted_bytes": 0,
+            "usage_bytes": {},
+            "total_bytes": 0
+        }
+        self._status_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age or self.category_quota or self.global_quota or self.category_quotas)
+
+    def start(self):
+        """启动后台线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+        self._thread.start()
+        with self._status_lock:
+            self._status["running"] = True
+        logger.info("保留策略已启动: 最长保存 %g 天, 类别配额 %s 字节, 全局配额 %s 字节",
+                    self.max_age / 86400, self.category_quota, self.global_quota)
+
+    def stop(self, timeout: float = 5):
+        """停止后台线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._status_lock:
+            self._status["running"] = False
+
+    def status(self) -> dict:
+        """最近一轮的统计信息"""
+        with self._status_lock:
+            return dict(self._status, usage_bytes=dict(self._status["usage_bytes"]))
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                more = self.run_once()
+            except Exception as e:
+                logger.error("保留策略执行失败: %s", e)
+                more = False
+            # 还有积压时稍后立即继续，否则等待下一个周期
+            self._stop.wait(self.pause if more else self.interval)
+
+    def _categories(self):
+        categories = set()
+        for kind in RESULT_KINDS:
+            kind_dir = self.save_root / kind
+            if kind_dir.exists():
+                categories.update(d.name for d in os.scandir(kind_dir) if d.is_dir())
+        return sorted(categories)
+
+    def _scan_category(self, category: str, cutoff: float, seen: set):
+        """
+        扫描一个类别
+        Args:
+            seen: 本轮已计入占用的 inode，同一份内容的多个硬链接只计一次
+        Returns:
+            (总字节数, 过期文件列表, 最早的 batch_size 个未过期文件)，
+            文件以 (生成时间, 大小, kind, 路径) 表示
+        """
+        total = 0
+        expired = []
+        oldest = []  # 以负时间入堆，堆顶是当前保留集合中最新的文件
+
+        for kind in RESULT_KINDS:
+            for dirpath, _, filenames in os.walk(self.save_root / kind / category):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    created = result_time(result_key(name)) or st.st_mtime
+                    item = (created, st.st_size, kind, path)
+                    if st.st_nlink == 1:
+                        total += st.st_size
+                    elif (st.st_dev, st.st_ino) not in seen:
+                        seen.add((st.st_dev, st.st_ino))
+                        total += st.st_size
+
+                    if cutoff and created < cutoff:
+                        if len(expired) < self.batch_size:
+                            expired.append(item)
+                        continue
+
+                    if len(oldest) < self.batch_size:
+                        heapq.heappush(oldest, (-created, item))
+                    elif -oldest[0][0] > created:
+                        heapq.heapreplace(oldest, (-created, item))
+
+        return total, expired, sorted(item for _, item in oldest)
+
+    def _evict(self, category: str, item) -> int:
+        """
+        删除一个文件
+        Returns:
+            释放的字节数；文件还有其他硬链接时为 0。上传文件与 blob 共享 inode，删除后只剩 blob
+            一个链接（删除前 nlink <= 2）时计为释放，blob 在本轮结束后由 on_cycle 回收；
+            可视化结果没有 blob，只有删除最后一个链接（nlink <= 1）才释放空间
+        """
+        _, size, kind, path = item
+        try:
+            links = os.stat(path).st_nlink
+            os.unlink(path)
+        except FileNotFoundError:
+            return 0
+
+        if self.on_evict is not None:
+            try:
+                self.on_evict(kind, category, Path(path))
+            except Exception as e:
+                logger.warning("淘汰回调失败: %s: %s", path, e)
+        return size if links <= (2 if kind == "uploads" else 1) else 0
+
+    def run_once(self) -> bool:
+        """
+        执行一轮淘汰
+        Returns:
+            是否还有未完成的淘汰工作
+        """
+        start = time.time()
+        cutoff = start - self.max_age if self.max_age else 0
+        usage = {}
+        seen = set()
+        candidates = []
+        evicted_files = 0
+        evicted_bytes = 0
+        more = False
+
+        for category in self._categories():
+            if self._stop.is_set():
+                break
+
+            total, expired, oldest = self._scan_category(category, cutoff, seen)
+
+            # 1. 超过最长保存时间的文件
+            for item in expired:
+                freed = self._evict(category, item)
+                total -= freed
+                evicted_bytes += freed
+                evicted_files += 1
+            if len(expired) >= self.batch_size:
+                more = True
+
+            # 2. 类别配额，从最早的开始淘汰
+            quota = self.category_quotas.get(category, self.category_quota)
+            remaining = oldest
+            if quota and total > quota:
+                remaining = []
+                for item in oldest:
+                    if total > quota:
+                        freed = self._evict(category, item)
+                        total -= freed
+                        evicted_bytes += freed
+                        evicted_files += 1
+                    else:
+                        remaining.append(item)
+                if total > quota:
+                    more = True
+
+            usage[category] = total
+            candidates.extend((item[0], category, item) for item in remaining)
+            self._stop.wait(self.pause)
+
+        # 3. 全局配额，在所有类别中选最早的文件
+        total_bytes = sum(usage.values())
+        if self.global_quota and total_bytes > self.global_quota:
+            for _, category, item in heapq.nsmallest(self.batch_size, candidates):
+                if total_bytes <= self.global_quota:
+                    break
+                freed = self._evict(category, item)
+                usage[category] -= freed
+                total_bytes -= freed
+                evicted_bytes += freed
+                evicted_files += 1
+            if total_bytes > self.global_quota:
+                more = True
+
+        with self._status_lock:
+            self._status.update({
+                "last_run": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start)),
+                "last_duration_seconds": round(time.time() - start, 3),
+                "evicted_files": self._status["evicted_files"] + evicted_files,
+                "evicted_bytes": self._status["evicted_bytes"] + evicted_bytes,
+                "usage_bytes": usage,
+                "total_bytes": total_bytes
+            })
+
+        if evicted_files:
+            logger.info("保留策略淘汰 %s 个文件, 释放 %.2fMB", evicted_files, evicted_bytes / 1024 / 1024)
+            if self.on_cycle is not None:
+                self.on_cycle()
+        return more
\ No newline at end of file
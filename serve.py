@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+生产环境启动入口（gunicorn）
+主进程导入应用并加载、预热模型后再 fork 工作进程，权重通过写时复制在各进程间共享；
+收到 SIGTERM 时停止接收新连接，等待正在处理的请求完成（最长 graceful_timeout 秒）后退出；
+工作进程始终使用 gthread 类型：请求在线程中处理，主循环照常向主进程上报心跳，
+归档上传等耗时较长的请求不会因为超过 timeout 被当作卡死的进程杀掉
+
+依赖: pip install gunicorn
+启动: python serve.py --workers 4 --threads 2
+默认端口: http://0.0.0.0:5000
+
+与开发服务器对比吞吐量（两种方式分别启动后，用同一台机器、同一组图片压测）:
+    python app.py                       # 开发服务器
+    python serve.py -w 4 -t 2           # 生产入口
+    # 另开终端压测，比较两份报告中的吞吐量和延迟分位数
+    python test_results_api.py --url http://localhost:5000 --load --concurrency 8 --duration 60 --output report.json
+"""
+
+import os
+import gc
+import fcntl
+import logging
+import argparse
+from pathlib import Path
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_log_file(log_file: str, pid: int) -> str:
+    """每个工作进程写自己的日志文件，避免多个进程同时轮转同一个文件"""
+    path = Path(log_file)
+    return str(path.with_name(f"{path.stem}.{pid}{path.suffix}"))
+
+
+def _acquire_leader_lock(lock_path: Path):
+    """
+    非阻塞地获取文件锁，获取成功的进程负责运行保留策略等后台任务
+    进程退出时锁自动释放，之后 fork 出的工作进程会接替
+    Returns:
+        持有锁的文件对象，未获取到时返回 None
+    """
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(lock_path, "w")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def post_fork(server, worker):
+    """工作进程启动后：重建日志写线程，限制推理线程数，选出一个进程运行后台任务"""
+    import app as api
+    from log_config import setup_logging
+
+    # fork 后子进程里只剩调用 fork 的线程，父进程的日志写线程需要重新启动
+    setup_logging(
+        log_file=_worker_log_file(api.LOG_FILE, os.getpid()),
+        level=getattr(logging, api.LOG_LEVEL, logging.INFO),
+        max_bytes=api.LOG_MAX_MB * 1024 * 1024,
+        backup_count=api.LOG_BACKUPS,
+        sample_rate=api.LOG_SAMPLE_RATE
+    )
+
+    torch_threads = int(os.environ.get("TORCH_THREADS", "0"))
+    if torch_threads:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except ImportError:
+            pass
+
+    worker.leader_lock = _acquire_leader_lock(api.SAVE_ROOT / ".cache" / "leader.lock")
+    api.start_background_services(retention=worker.leader_lock is not None)
+    logger.info("工作进程 %s 已启动%s", os.getpid(), "（负责后台任务）" if worker.leader_lock else "")
+
+
+def worker_exit(server, worker):
+    """工作进程退出前停止后台任务，并把队列中剩余的日志写完"""
+    import app as api
+    from log_config import stop_logging
+
+    api.stop_background_services()
+    logger.info("工作进程 %s 退出", os.getpid())
+    stop_logging()
+
+
+class ServeApplication(BaseApplication or object):
+    """在主进程中加载应用和模型的 gunicorn 应用"""
+
+    def __init__(self, options: dict, weights: Path, warmup: bool = True):
+        self.options = options
+        self.weights = weights
+        self.warmup = warmup
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        self.cfg.set("post_fork", post_fork)
+        self.cfg.set("worker_exit", worker_exit)
+
+    def load(self):
+        import app as api
+        from predict import load_model, warmup_model
+
+        if self.warmup:
+            warmup_model(self.weights)
+        else:
+            load_model(self.weights)
+
+        # 把已有对象移出垃圾回收的跟踪范围，避免工作进程中的 GC 触碰这些对象导致共享内存页被复制
+        gc.collect()
+        gc.freeze()
+        return api.app
+
+
+def main():
+    """命令行主函数"""
+    parser = argparse.ArgumentParser(description="YOLOv8 API 生产环境启动")
+    parser.add_argument("-b", "--bind", default=os.environ.get("BIND", "0.0.0.0:5000"), help="监听地址")
+    parser.add_argument("-w", "--workers", type=int, default=int(os.environ.get("WORKERS", "2")),
+                        help="工作进程数")
+    parser.add_argument("-t", "--threads", type=int, default=int(os.environ.get("THREADS", "1")),
+                        help="每个工作进程的线程数")
+    parser.add_argument("--timeout", type=int, default=120,
+                        help="工作进程多久没有心跳后被重启（秒），不限制单个请求的处理时间")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="优雅退出时等待请求完成的时间（秒）")
+    parser.add_argument("--max-requests", type=int, default=0, help="工作进程处理多少个请求后重启，0 表示不重启")
+    parser.add_argument("--weights", default="weights/yolov8n.pt", help="模型权重文件路径")
+    parser.add_argument("--no-warmup", action="store_true", help="只加载模型，不做预热推理")
+    args = parser.parse_args()
+
+    if BaseApplication is None:
+        print("错误: 未安装 gunicorn，请先执行 pip install gunicorn")
+        return 1
+
+    weights = Path(args.weights)
+    if not weights.exists():
+        print(f"错误: 权重文件不存在: {weights}")
+        return 1
+
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        # sync 工作进程处理请求期间不上报心跳，超过 timeout 的归档上传会被强制杀掉
+        "worker_class": "gthread",
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "preload_app": True
+    }
+
+    print(f"启动生产服务: {args.bind}, {args.workers} 个工作进程 x {args.threads} 个线程")
+    ServeApplication(options, weights, warmup=not args.no_warmup).run()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
\ No newline at end of file
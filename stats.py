@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+统计模块
+基于检测记录（records.py）增量维护聚合统计：按类别和检测类别统计结果数、检测数、
+置信度分布、每小时吞吐量和写入字节数。
+
+每次刷新只读取当天记录文件中上次读取位置之后新追加的行并累加到累计值上，多个工作进程写入的记录都会被统计到；
+读取位置和各记录文件的聚合结果定期保存为快照，重启后从快照继续，不必重新扫描全部记录。
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+
+from records import RECORDS_DIR
+
+logger = logging.getLogger(__name__)
+
+# 置信度直方图的桶数，[0, 0.1), [0.1, 0.2) ... [0.9, 1.0]
+CONFIDENCE_BUCKETS = 10
+# 吞吐量统计返回最近多少小时
+THROUGHPUT_HOURS = 24
+SNAPSHOT_VERSION = 1
+
+
+def _empty_aggregate() -> dict:
+    return {
+        "results": 0,
+        "detections": 0,
+        "empty_results": 0,
+        "upload_bytes": 0,
+        "stored_upload_bytes": 0,
+        "vis_bytes": 0,
+        "classes": {},
+        "hours": {}
+    }
+
+
+def _first_hour() -> int:
+    """吞吐量统计窗口中最早一小时的起始时间"""
+    return int(time.time() // 3600 * 3600) - (THROUGHPUT_HOURS - 1) * 3600
+
+
+def _add_record(agg: dict, record: dict, first_hour: int = 0):
+    """把一条检测记录计入聚合结果，早于 first_hour 的记录不计入每小时吞吐量"""
+    detections = record.get("detections") or []
+    agg["results"] += 1
+    agg["detections"] += len(detections)
+    if not detections:
+        agg["empty_results"] += 1
+
+    upload_bytes = record.get("upload_bytes") or 0
+    agg["upload_bytes"] += upload_bytes
+    if not record.get("deduplicated"):
+        agg["stored_upload_bytes"] += upload_bytes
+    agg["vis_bytes"] += record.get("vis_bytes") or 0
+
+    hour = int(record["time"] // 3600 * 3600)
+    if hour >= first_hour:
+        agg["hours"][str(hour)] = agg["hours"].get(str(hour), 0) + 1
+
+    for detection in detections:
+        cls = agg["classes"].get(detection["class_name"])
+        if cls is None:
+            cls = agg["classes"][detection["class_name"]] = {
+                "class_id": detection["class_id"],
+                "count": 0,
+                "confidence_sum": 0.0,
+                "histogram": [0] * CONFIDENCE_BUCKETS
+            }
+        confidence = detection["confidence"]
+        cls["count"] += 1
+        cls["confidence_sum"] += confidence
+        cls["histogram"][min(int(confidence * CONFIDENCE_BUCKETS), CONFIDENCE_BUCKETS - 1)] += 1
+
+
+def _merge(target: dict, source: dict, sign: int = 1):
+    """把 source 的聚合结果累加到 target，sign 为 -1 时减去（记录文件被删除时）"""
+    for key in ("results", "detections", "empty_results", "upload_bytes", "stored_upload_bytes", "vis_bytes"):
+        target[key] += sign * source[key]
+    for hour, count in source["hours"].items():
+        count = target["hours"].get(hour, 0) + sign * count
+        if count > 0:
+            target["hours"][hour] = count
+        else:
+            target["hours"].pop(hour, None)
+    for name, cls in source["classes"].items():
+        merged = target["classes"].get(name)
+        if merged is None:
+            merged = target["classes"][name] = {
+                "class_id": cls["class_id"],
+                "count": 0,
+                "confidence_sum": 0.0,
+                "histogram": [0] * CONFIDENCE_BUCKETS
+            }
+        merged["count"] += sign * cls["count"]
+        merged["confidence_sum"] += sign * cls["confidence_sum"]
+        merged["histogram"] = [a + sign * b for a, b in zip(merged["histogram"], cls["histogram"])]
+        if merged["count"] <= 0:
+            del target["classes"][name]
+
+
+def _trim_hours(agg: dict, first_hour: int):
+    """丢弃吞吐量统计窗口之外的小时"""
+    for hour in [hour for hour in agg["hours"] if int(hour) < first_hour]:
+        del agg["hours"][hour]
+
+
+def _format_classes(classes: dict) -> dict:
+    return {
+        name: {
+            "class_id": cls["class_id"],
+            "count": cls["count"],
+            "mean_confidence": round(cls["confidence_sum"] / cls["count"], 4) if cls["count"] else None,
+            "confidence_histogram": cls["histogram"]
+        }
+        for name, cls in sorted(classes.items(), key=lambda item: -item[1]["count"])
+    }
+
+
+def _format_throughput(hours: dict) -> list:
+    """最近 THROUGHPUT_HOURS 小时每小时的结果数"""
+    now_hour = int(time.time() // 3600 * 3600)
+    return [
+        {"hour": time.strftime('%Y-%m-%d %H:00', time.localtime(hour)), "results": hours.get(str(hour), 0)}
+        for hour in range(now_hour - (THROUGHPUT_HOURS - 1) * 3600, now_hour + 1, 3600)
+    ]
+
+
+def _format_aggregate(agg: dict) -> dict:
+    """对外返回的统计格式"""
+    return {
+        "results": agg["results"],
+        "detections": agg["detections"],
+        "empty_results": agg["empty_results"],
+        "upload_bytes": agg["upload_bytes"],
+        "stored_upload_bytes": agg["stored_upload_bytes"],
+        "vis_bytes": agg["vis_bytes"],
+        "throughput_per_hour": _format_throughput(agg["hours"]),
+        "classes": _format_classes(agg["classes"])
+    }
+
+
+class StatsAggregator:
+    """
+    增量聚合统计
+    按类别和总计维护累计值，每读到一条新记录就把它累加上去，查询时直接格式化累计值；
+    同时以记录文件为单位保存聚合结果和读取位置，记录文件被清理后从累计值中减去对应部分。
+
+    刷新时不列出、不 stat 全部记录文件：记录目录和类别目录的修改时间只在增删文件时变化，
+    没有变化时每个类别只需检查当天（最新）的记录文件
+    """
+
+    def __init__(self, save_root: Path, snapshot_path: Path = None, snapshot_interval: float = 60,
+                 refresh_interval: float = 1):
+        """
+        Args:
+            save_root: 结果根目录
+            snapshot_path: 快照文件路径，None 表示不保存快照
+            snapshot_interval: 保存快照的最短间隔（秒）
+            refresh_interval: 两次检查新记录的最短间隔（秒），期间直接返回缓存的统计
+        """
+        self.save_root = Path(save_root)
+        self.records_dir = self.save_root / RECORDS_DIR
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        # 记录文件相对路径 -> {"category", "inode", "offset", "agg"}
+        self._files = {}
+        # 类别 -> 累计值，以及全部类别的总计
+        self._categories = {}
+        self._total = _empty_aggregate()
+        # 类别 -> 当天（最新）的记录文件相对路径
+        self._current = {}
+        # 目录路径 -> 上次列出目录时的修改时间
+        self._dir_mtimes = {}
+        self._summary = None
+        self._summary_hour = None
+        self._last_refresh = None
+        self._last_snapshot = time.monotonic()
+        self._load_snapshot()
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not self.snapshot_path.exists():
+            return
+        try:
+            snapshot = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            if snapshot.get("version") == SNAPSHOT_VERSION:
+                self._files = snapshot["files"]
+                logger.info("加载统计快照: %s 个记录文件", len(self._files))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("统计快照无效，重新统计: %s", e)
+            self._files = {}
+
+        # 累计值只在加载快照时由各文件的聚合结果合并一次
+        first_hour = _first_hour()
+        for entry in self._files.values():
+            _trim_hours(entry["agg"], first_hour)
+            self._apply(entry["category"], entry["agg"])
+
+    def _save_snapshot(self):
+        path = self.snapshot_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps({"version": SNAPSHOT_VERSION, "files": self._files}), encoding="utf-8")
+        os.replace(tmp_path, path)
+        self._last_snapshot = time.monotonic()
+
+    def _apply(self, category: str, agg: dict, sign: int = 1):
+        """把一个记录文件的聚合结果加到（或从中减去）类别累计值和总计"""
+        cat_agg = self._categories.get(category)
+        if cat_agg is None:
+            cat_agg = self._categories[category] = _empty_aggregate()
+        _merge(cat_agg, agg, sign)
+        _merge(self._total, agg, sign)
+
+    def _drop_file(self, key: str):
+        entry = self._files.pop(key)
+        self._apply(entry["category"], entry["agg"], -1)
+
+    def _dir_changed(self, path: Path) -> bool:
+        """目录中是否增删了文件或子目录（修改时间与上次列出时不同）"""
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        previous = self._dir_mtimes.get(path, -1)
+        # 修改时间距今太近时，同一时间粒度内可能还有变化，不记录，下次再列一遍
+        fresh = mtime is not None and time.time_ns() - mtime < 2 * 10 ** 9
+        self._dir_mtimes[path] = -1 if fresh else mtime
+        return previous == -1 or mtime != previous
+
+    def _read_new(self, key: str, path: Path, category: str) -> bool:
+        """读取记录文件中新追加的完整行并累加，返回是否有变化"""
+        st = path.stat()
+        entry = self._files.get(key)
+        # 文件被替换或截断时重新统计
+        if entry is not None and (entry["inode"] != st.st_ino or entry["offset"] > st.st_size):
+            self._drop_file(key)
+            entry = None
+        if entry is None:
+            entry = self._files[key] = {"category": category, "inode": st.st_ino, "offset": 0,
+                                        "agg": _empty_aggregate()}
+        if entry["offset"] == st.st_size:
+            return False
+
+        cat_agg = self._categories.get(category)
+        if cat_agg is None:
+            cat_agg = self._categories[category] = _empty_aggregate()
+        aggs = (entry["agg"], cat_agg, self._total)
+        first_hour = _first_hour()
+
+        with open(path, "rb") as f:
+            f.seek(entry["offset"])
+            for line in f:
+                # 最后一行可能正在写入，下次再读
+                if not line.endswith(b"\n"):
+                    break
+                entry["offset"] += len(line)
+                try:
+                    record = json.loads(line)
+                    for agg in aggs:
+                        _add_record(agg, record, first_hour)
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("跳过无法解析的检测记录: %s", path)
+        return True
+
+    def _drop_category(self, category: str) -> bool:
+        """类别的记录目录已被删除"""
+        keys = [key for key, entry in self._files.items() if entry["category"] == category]
+        for key in keys:
+            del self._files[key]
+        cat_agg = self._categories.pop(category, None)
+        if cat_agg is not None:
+            _merge(self._total, cat_agg, -1)
+        self._current.pop(category, None)
+        self._dir_mtimes.pop(self.records_dir / category, None)
+        return bool(keys) or cat_agg is not None
+
+    def _scan_category(self, category: str) -> bool:
+        """类别目录有增删时重新列出记录文件：移除已删除的文件，读取各文件的新增内容"""
+        cat_dir = self.records_dir / category
+        try:
+            paths = sorted(cat_dir.glob("*.jsonl")) if cat_dir.is_dir() else []
+        except FileNotFoundError:
+            paths = []
+        keys = {f"{category}/{path.name}": path for path in paths}
+
+        changed = False
+        for key in [key for key, entry in self._files.items() if entry["category"] == category and key not in keys]:
+            self._drop_file(key)
+            changed = True
+        for key, path in keys.items():
+            try:
+                changed |= self._read_new(key, path, category)
+            except FileNotFoundError:
+                if key in self._files:
+                    self._drop_file(key)
+                    changed = True
+        self._current[category] = max(keys) if keys else None
+        return changed
+
+    def refresh(self) -> bool:
+        """
+        读取新追加的记录并更新统计
+        Returns:
+            统计是否有变化
+        """
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            changed = False
+
+            if self._dir_changed(self.records_dir):
+                try:
+                    names = {d.name for d in os.scandir(self.records_dir) if d.is_dir()}
+                except FileNotFoundError:
+                    names = set()
+                watched = set(self._current) | {entry["category"] for entry in self._files.values()}
+                for category in watched - names:
+                    changed |= self._drop_category(category)
+                for category in names:
+                    self._current.setdefault(category, None)
+
+            for category in list(self._current):
+                if self._dir_changed(self.records_dir / category):
+                    changed |= self._scan_category(category)
+                elif self._current[category]:
+                    key = self._current[category]
+                    try:
+                        changed |= self._read_new(key, self.records_dir / key, category)
+                    except FileNotFoundError:
+                        changed |= self._scan_category(category)
+
+            if changed:
+                self._summary = None
+                if self.snapshot_path and time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                    try:
+                        self._save_snapshot()
+                    except OSError as e:
+                        logger.warning("保存统计快照失败: %s", e)
+            return changed
+
+    def _build_summary(self) -> dict:
+        summary = _format_aggregate(self._total)
+        categories = {name: agg for name, agg in self._categories.items() if agg["results"] > 0}
+        summary.update({
+            "category_count": len(categories),
+            "categories": {name: _format_aggregate(agg) for name, agg in sorted(categories.items())},
+            "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')
+        })
+        return summary
+
+    def summary(self, category: str = None) -> dict:
+        """
+        当前统计，没有新记录时直接返回缓存的结果
+        Args:
+            category: 只返回指定类别的统计，类别不存在时返回 None
+        """
+        if self._last_refresh is None or time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+        with self._lock:
+            # 吞吐量按小时滚动，跨小时后丢弃窗口之外的小时并重新生成
+            hour = int(time.time() // 3600)
+            if self._summary_hour != hour:
+                first_hour = _first_hour()
+                for agg in [entry["agg"] for entry in self._files.values()] + \
+                        list(self._categories.values()) + [self._total]:
+                    _trim_hours(agg, first_hour)
+                self._summary = None
+                self._summary_hour = hour
+            if self._summary is None:
+                self._summary = self._build_summary()
+            summary = self._summary
+
+        if category is None:
+            return summary
+        return summary["categories"].get(category)
+
+    def flush(self):
+        """立即保存快照（退出前调用）"""
+        if not self.snapshot_path:
+            return
+        with self._lock:
+            try:
+                self._save_snapshot()
+            except OSError as e:
+                logger.warning("保存统计快照失败: %s", e)
\ No newline at end of file
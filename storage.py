@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+结果存储模块
+上传文件按内容哈希存放在 blobs/ 下，uploads/<category>/ 中的文件是指向 blob 的硬链接，
+相同内容只占一份磁盘空间，列表、下载等按目录读取的接口无需改动；
+类别目录下可按日期和/或文件名哈希分片，避免单个目录文件过多
+
+迁移已有文件到新的分片布局:
+    python storage.py migrate --layout date+hash
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIR = "blobs"
+# 分片布局：flat 不分片；date 按 年/月/日；hash 按文件名哈希两级；date+hash 按日期再加一级哈希
+LAYOUTS = ("flat", "date", "hash", "date+hash")
+RESULT_KINDS = ("uploads", "visualizations")
+
+
+# 结果ID使用 ULID 格式：48 位毫秒时间戳 + 80 位随机数，Crockford Base32 编码为 26 个字符，
+# 字典序即时间序；同一毫秒内递增随机部分，保证单进程内严格单调
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_id_lock = threading.Lock()
+_last_ms = 0
+_last_rand = 0
+
+
+def new_result_id() -> str:
+    """生成单调递增、可排序的唯一结果ID"""
+    global _last_ms, _last_rand
+
+    with _id_lock:
+        ms = int(time.time() * 1000)
+        if ms <= _last_ms:
+            ms = _last_ms
+            rand = _last_rand + 1
+            if rand >= 1 << 80:
+                ms += 1
+                rand = 0
+        else:
+            rand = int.from_bytes(os.urandom(10), "big")
+        _last_ms, _last_rand = ms, rand
+
+    value = (ms << 80) | rand
+    chars = []
+    for _ in range(26):
+        chars.append(_CROCKFORD[value & 0x1F])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def is_result_id(value: str) -> bool:
+    """判断字符串是否为 ULID 格式的结果ID"""
+    return len(value) == 26 and value[0] <= "7" and all(c in _CROCKFORD for c in value)
+
+
+def result_id_time(result_id: str) -> float:
+    """取出结果ID中的时间（秒）"""
+    ms = 0
+    for c in result_id[:10]:
+        ms = (ms << 5) | _CROCKFORD.index(c)
+    return ms / 1000
+
+
+def result_key(filename: str) -> str:
+    """
+    从文件名中取出结果键，原图和可视化图得到同一个键
+    新格式: <结果ID>_<文件名> / vis_<结果ID>.<后缀>
+    旧格式: <时间戳>_<文件名> / vis_<时间戳>_<文件名>_<时间戳>.<后缀>
+    """
+    name = filename[4:] if filename.startswith("vis_") else filename
+    return os.path.splitext(name)[0].split("_", 1)[0]
+
+
+def result_time(key: str):
+    """结果键对应的时间（秒），无法解析时返回 None"""
+    if is_result_id(key):
+        return result_id_time(key)
+    if key.isdigit():
+        return int(key)
+    return None
+
+
+def result_sort_key(key: str, file_path: Path = None) -> tuple:
+    """
+    结果排序键 (毫秒时间, 结果键)
+    新旧两种命名可以混合排序；无法解析时间的文件退回到修改时间
+    """
+    if is_result_id(key):
+        return int(result_id_time(key) * 1000), key
+    if key.isdigit():
+        return int(key) * 1000, key
+    mtime = Path(file_path).stat().st_mtime if file_path is not None else 0
+    return int(mtime * 1000), key
+
+
+def shard_subdir(layout: str, filename: str, when: float = None) -> Path:
+    """
+    计算文件在类别目录下的分片子目录
+    Args:
+        layout: LAYOUTS 之一
+        filename: 上传文件名或可视化文件名，按结果键分片，同一结果的原图和可视化图落在同一分片
+        when: 日期分片使用的时间，默认取结果键中的时间，没有则取当前时间
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"不支持的存储布局: {layout}，可选: {', '.join(LAYOUTS)}")
+
+    key = result_key(filename)
+    parts = []
+    if "date" in layout:
+        if when is None:
+            when = result_time(key) or time.time()
+        parts.extend(time.strftime("%Y/%m/%d", time.localtime(when)).split("/"))
+    if "hash" in layout:
+        digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+        parts.extend([digest[:2], digest[2:4]] if layout == "hash" else [digest[:2]])
+    return Path(*parts) if parts else Path()
+
+
+def iter_files(directory: Path):
+    """递归列出目录（含分片子目录）中的文件，跳过隐藏的临时文件"""
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.startswith("."):
+                yield Path(dirpath) / name
+
+
+def content_hash(data: bytes) -> str:
+    """计算内容哈希（SHA-256 十六进制）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_path(save_root: Path, digest: str, suffix: str = "") -> Path:
+    """blob 路径，按哈希前缀分两级子目录: blobs/ab/cd/<hash><后缀>"""
+    return Path(save_root) / BLOB_DIR / digest[:2] / digest[2:4] / f"{digest}{suffix.lower()}"
+
+
+def _write_atomic(path: Path, data: bytes):
+    """先写临时文件再原子替换，并发写入同一 blob 时不会出现半个文件"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def store_upload(save_root: Path, data: bytes, dest: Path) -> dict:
+    """
+    按内容寻址保存上传文件
+    Args:
+        save_root: 结果根目录
+        data: 文件内容
+        dest: 记录路径（uploads/<category>/<文件名>），会创建为指向 blob 的硬链接
+    Returns:
+        {"content_hash", "blob_path", "deduplicated"}
+    """
+    digest = content_hash(data)
+    blob = blob_path(save_root, digest, Path(dest).suffix)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+
+    deduplicated = blob.exists()
+    for _ in range(3):
+        if not blob.exists():
+            _write_atomic(blob, data)
+        try:
+            os.link(blob, dest)
+            break
+        except FileExistsError:
+            # 同名记录已存在时覆盖，与直接保存文件的行为一致
+            dest.unlink()
+            continue
+        except FileNotFoundError:
+            # blob 刚好被孤立 blob 回收删掉，或目录被清理任务移走，重新写入后再试一次
+            deduplicated = False
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            continue
+        except OSError as e:
+            # 文件系统不支持硬链接时退化为普通写入
+            logger.warning("创建硬链接失败，改为直接写入: %s: %s", dest, e)
+            _write_atomic(dest, data)
+            break
+    else:
+        raise RuntimeError(f"保存上传文件失败: {dest}")
+
+    if deduplicated:
+        logger.info("上传内容重复，复用已有 blob: %s", blob.name)
+
+    return {
+        "content_hash": digest,
+        "blob_path": str(blob),
+        "deduplicated": deduplicated
+    }
+
+
+def collect_orphan_blobs(save_root: Path) -> int:
+    """
+    删除没有任何上传记录引用的 blob（硬链接数为 1）
+    Returns:
+        删除的 blob 数量
+    """
+    removed = 0
+    blob_root = Path(save_root) / BLOB_DIR
+    if not blob_root.exists():
+        return 0
+
+    for dirpath, _, filenames in os.walk(blob_root):
+        for name in filenames:
+            # 跳过正在写入的临时文件
+            if name.startswith("."):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                if os.stat(path).st_nlink == 1:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+
+    if removed:
+        logger.info("回收孤立 blob %s 个", removed)
+    return removed
+
+
+def disk_usage(save_root: Path) -> dict:
+    """
+    各类别上传文件和可视化文件占用的字节数
+    内容相同的上传文件都是同一个 blob 的硬链接，按 inode 只计一次
+    Returns:
+        {类别: 字节数}
+    """
+    usage = {}
+    seen = set()
+    for kind in RESULT_KINDS:
+        kind_dir = Path(save_root) / kind
+        if not kind_dir.exists():
+            continue
+        for entry in os.scandir(kind_dir):
+            if not entry.is_dir():
+                continue
+            total = usage.get(entry.name, 0)
+            for dirpath, _, filenames in os.walk(entry.path):
+                for name in filenames:
+                    try:
+                        st = os.stat(os.path.join(dirpath, name))
+                    except FileNotFoundError:
+                        continue
+                    if st.st_nlink > 1:
+                        if (st.st_dev, st.st_ino) in seen:
+                            continue
+                        seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
+            usage[entry.name] = total
+    return usage
+
+
+class UsageMonitor:
+    """
+    后台定期统计各类别磁盘占用，结果写入快照文件
+    多进程部署时只需一个进程运行统计线程，其他进程读取快照；读取方不遍历目录
+    """
+
+    def __init__(self, save_root: Path, snapshot_path: Path, interval: float = 60):
+        self.save_root = Path(save_root)
+        self.snapshot_path = Path(snapshot_path)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._usage = {}
+        self._mtime = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动后台统计线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="disk-usage", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """停止后台统计线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("统计磁盘占用失败: %s", e)
+            self._stop.wait(self.interval)
+
+    def refresh(self) -> dict:
+        """遍历结果目录重新统计，并更新快照"""
+        usage = disk_usage(self.save_root)
+        _write_atomic(self.snapshot_path, json.dumps(usage).encode("utf-8"))
+        with self._lock:
+            self._usage = usage
+            self._mtime = os.stat(self.snapshot_path).st_mtime_ns
+        return usage
+
+    def usage(self) -> dict:
+        """最近一次的统计结果；快照被统计进程更新后重新读取，尚未统计过时为空"""
+        try:
+            mtime = os.stat(self.snapshot_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if mtime is not None and mtime != self._mtime:
+                try:
+                    self._usage = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+                    self._mtime = mtime
+                except (OSError, ValueError) as e:
+                    logger.warning("读取磁盘占用快照失败: %s", e)
+            return dict(self._usage)
+
+
+def migrate_layout(save_root: Path, layout: str) -> dict:
+    """
+    把已有的上传文件和可视化文件移动到指定的分片布局
+    原图和可视化图按结果键分片，迁移后仍落在同一分片
+    Returns:
+        {"moved", "skipped"} 统计
+    """
+    save_root = Path(save_root)
+    moved = 0
+    skipped = 0
+
+    for kind in RESULT_KINDS:
+        kind_dir = save_root / kind
+        if not kind_dir.exists():
+            continue
+
+        for category_dir in [d for d in kind_dir.iterdir() if d.is_dir()]:
+            for file_path in list(iter_files(category_dir)):
+                when = result_time(result_key(file_path.name)) or file_path.stat().st_mtime
+                target = category_dir / shard_subdir(layout, file_path.name, when=when) / file_path.name
+                if target == file_path:
+                    skipped += 1
+                    continue
+                if target.exists():
+                    logger.warning("目标已存在，跳过: %s", target)
+                    skipped += 1
+                    continue
+
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.rename(file_path, target)
+                moved += 1
+
+            # 删除迁移后留下的空分片目录
+            for dirpath, _, _ in sorted(os.walk(category_dir), key=lambda x: len(x[0]), reverse=True):
+                if Path(dirpath) != category_dir:
+                    try:
+                        os.rmdir(dirpath)
+                    except OSError:
+                        pass
+
+    # 缩略图缓存按旧路径保存，迁移后直接清空，之后按需重新生成
+    shutil.rmtree(save_root / ".cache" / "thumbnails", ignore_errors=True)
+
+    logger.info("存储布局迁移完成: %s, 移动 %s 个文件, 跳过 %s 个", layout, moved, skipped)
+    return {"moved": moved, "skipped": skipped}
+
+
+def main():
+    """命令行主函数"""
+    parser = argparse.ArgumentParser(description="结果存储维护工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate = subparsers.add_parser("migrate", help="迁移已有文件到新的分片布局")
+    migrate.add_argument("--root", default="runs/api_test", help="结果根目录")
+    migrate.add_argument("--layout", required=True, choices=LAYOUTS, help="目标布局")
+
+    gc = subparsers.add_parser("gc", help="回收不再被引用的 blob")
+    gc.add_argument("--root", default="runs/api_test", help="结果根目录")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    root = Path(args.root)
+    if not root.exists():
+        print(f"错误: 结果目录不存在: {root}")
+        return 1
+
+    if args.command == "migrate":
+        print(f"开始迁移: {root} -> {args.layout}")
+        stats = migrate_layout(root, args.layout)
+        print(f"迁移完成: 移动 {stats['moved']} 个文件, 跳过 {stats['skipped']} 个")
+        print(f"请将服务的 STORAGE_LAYOUT 设置为 {args.layout} 后重启")
+    elif args.command == "gc":
+        removed = collect_orphan_blobs(root)
+        print(f"回收孤立 blob {removed} 个")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
\ No newline at end of file
@@ -2,13 +2,71 @@
 """
 结果管理 API 测试脚本
 用于测试批量下载等新增功能
+
+压测模式（使用生成的图片，不依赖本地图片文件）:
+    # 闭环：8 个并发客户端持续发送请求 60 秒
+    python test_results_api.py --url http://localhost:5000 --load --concurrency 8 --duration 60
+    # 开环：按每秒 20 个请求的固定速率发送，指定请求比例，报告写入 JSON
+    python test_results_api.py --url http://localhost:5000 --load --rate 20 --duration 60 \
+        --mix single=6,multiple=1,list=2,download=1 --output load_report.json
 """
 
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import time
+import queue
+import random
+import itertools
+import threading
 from pathlib import Path
 
+# 压测请求类型及默认比例
+LOAD_OPERATIONS = ("single", "multiple", "list", "download")
+DEFAULT_LOAD_MIX = "single=6,multiple=1,list=2,download=1"
+
+
+def parse_mix(value: str) -> dict:
+    """解析请求比例，形如 single=6,list=2"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in LOAD_OPERATIONS:
+            raise ValueError(f"未知的请求类型: {name}，可选: {', '.join(LOAD_OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def generate_images(count: int, width: int = 640, height: int = 480) -> list:
+    """生成若干张内容不同的 JPEG 图片，作为压测上传的底图，每次上传前由 stamp_image 加上序号"""
+    import cv2
+    import numpy as np
+
+    images = []
+    for i in range(count):
+        img = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
+        cv2.putText(img, str(i), (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        images.append(cv2.imencode(".jpg", img)[1].tobytes())
+    return images
+
+
+def stamp_image(data: bytes, serial: int) -> bytes:
+    """
+    在 JPEG 文件头后插入带序号的注释段（COM），图像内容不变但每次上传的字节都不同，
+    服务端不会把压测请求当作重复内容去重或合并推理，而且不需要重新编码图片
+    """
+    comment = f"load-test {serial}".encode()
+    return data[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + data[2:]
+
+
+def percentile(sorted_values: list, p: float):
+    """已排序数据的百分位数（最近秩法）"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
 
 class ResultsAPITester:
     def __init__(self, base_url="http://192.168.115.133:5000"):
@@ -161,6 +219,206 @@ class ResultsAPITester:
 
         return True
 
+    def _load_session(self, pool_size: int) -> requests.Session:
+        """每个压测线程使用自己的连接池会话"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def _load_request(self, session, operation: str, images: list, category: str, files_per_request: int,
+                      serials=None):
+        """
+        发送一个压测请求，返回 (状态码, 响应字节数)
+        Args:
+            serials: 上传图片的序号生成器，每张上传的图片都带上不同的序号
+        """
+        serials = serials if serials is not None else itertools.count()
+        if operation == "single":
+            files = {"file": ("load.jpg", stamp_image(random.choice(images), next(serials)), "image/jpeg")}
+            response = session.post(f"{self.base_url}/upload/{category}/single", files=files, timeout=120)
+        elif operation == "multiple":
+            files = [("files", (f"load_{i}.jpg", stamp_image(random.choice(images), next(serials)), "image/jpeg"))
+                     for i in range(files_per_request)]
+            response = session.post(f"{self.base_url}/upload/{category}/multiple", files=files, timeout=300)
+        elif operation == "list":
+            response = session.get(f"{self.base_url}/results", timeout=60)
+        else:
+            response = session.get(f"{self.base_url}/results/download/{category}", timeout=300, stream=True)
+            size = sum(len(chunk) for chunk in response.iter_content(64 * 1024))
+            return response.status_code, size
+        return response.status_code, len(response.content)
+
+    def run_load_test(self, concurrency: int = 4,
+                      duration: float = 30,
+                      total_requests: int = 0,
+                      rate: float = 0,
+                      mix: dict = None,
+                      category: str = "loadtest",
+                      image_count: int = 20,
+                      files_per_request: int = 4,
+                      output: str = None) -> dict:
+        """
+        压测模式
+        Args:
+            concurrency: 并发线程数（开环模式下为最多同时进行的请求数）
+            duration: 持续时间（秒）
+            total_requests: 总请求数，大于 0 时达到后提前结束
+            rate: 大于 0 时为开环模式，按固定速率（请求/秒）发送，延迟从计划发送时间算起；
+                  否则为闭环模式，每个线程收到响应后立即发送下一个请求
+            mix: 各类请求的比例 {类型: 权重}
+            category: 上传使用的类别
+            image_count: 生成的测试图片数量
+            files_per_request: 批量上传每次的文件数
+            output: 报告 JSON 文件路径
+        Returns:
+            压测报告
+        """
+        mix = mix or parse_mix(DEFAULT_LOAD_MIX)
+        operations = list(mix)
+        weights = [mix[name] for name in operations]
+        images = generate_images(image_count)
+        serials = itertools.count()
+        self._local = threading.local()
+
+        print("🚀 开始压测")
+        print(f"测试服务器: {self.base_url}")
+        print(f"模式: {'开环 %.1f 请求/秒' % rate if rate else '闭环'}, 并发: {concurrency}, "
+              f"时长: {duration}s, 请求比例: {mix}")
+
+        lock = threading.Lock()
+        latencies = {name: [] for name in operations}
+        statuses = {name: {} for name in operations}
+        errors = {}
+        transferred = [0]
+        issued = [0]
+        stop = threading.Event()
+        start = time.perf_counter()
+        deadline = start + duration
+
+        def take_ticket() -> bool:
+            with lock:
+                if total_requests and issued[0] >= total_requests:
+                    return False
+                issued[0] += 1
+                return True
+
+        def execute(operation: str, scheduled: float):
+            session = self._load_session(concurrency)
+            try:
+                status, size = self._load_request(session, operation, images, category, files_per_request, serials)
+                key = str(status)
+            except Exception as e:
+                status, size, key = None, 0, type(e).__name__
+            elapsed = time.perf_counter() - scheduled
+            with lock:
+                latencies[operation].append(elapsed)
+                statuses[operation][key] = statuses[operation].get(key, 0) + 1
+                transferred[0] += size
+                if status is None or status >= 400:
+                    errors[key] = errors.get(key, 0) + 1
+
+        def closed_loop_worker():
+            while not stop.is_set() and time.perf_counter() < deadline and take_ticket():
+                execute(random.choices(operations, weights)[0], time.perf_counter())
+
+        def open_loop_worker(tasks):
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                execute(*task)
+
+        if rate:
+            # 开环：调度线程按计划时间投放请求，服务变慢时请求在本地排队，排队时间计入延迟
+            tasks = queue.Queue()
+            workers = [threading.Thread(target=open_loop_worker, args=(tasks,), daemon=True)
+                       for _ in range(concurrency)]
+            for worker in workers:
+                worker.start()
+            interval = 1.0 / rate
+            next_time = start
+            while next_time < deadline and take_ticket():
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                tasks.put((random.choices(operations, weights)[0], next_time))
+                next_time += interval
+            for _ in workers:
+                tasks.put(None)
+        else:
+            workers = [threading.Thread(target=closed_loop_worker, daemon=True) for _ in range(concurrency)]
+            for worker in workers:
+                worker.start()
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            print("\n⚠️  压测被中断，统计已完成的请求")
+        wall_time = time.perf_counter() - start
+        completed = sum(len(v) for v in latencies.values())
+
+        report = {
+            "base_url": self.base_url,
+            "mode": "open" if rate else "closed",
+            "target_rate": rate or None,
+            "concurrency": concurrency,
+            "duration_seconds": round(wall_time, 3),
+            "mix": mix,
+            "total_requests": completed,
+            "throughput_rps": round(completed / wall_time, 3) if wall_time else 0,
+            "transferred_bytes": transferred[0],
+            "errors": errors,
+            "operations": {}
+        }
+
+        for name in operations:
+            values = sorted(latencies[name])
+            ok = sum(count for code, count in statuses[name].items() if code.isdigit() and int(code) < 400)
+            report["operations"][name] = {
+                "requests": len(values),
+                "succeeded": ok,
+                "throughput_rps": round(len(values) / wall_time, 3) if wall_time else 0,
+                "status_codes": statuses[name],
+                "latency_ms": {
+                    key: round(value * 1000, 2) if value is not None else None
+                    for key, value in (
+                        ("mean", sum(values) / len(values) if values else None),
+                        ("p50", percentile(values, 50)),
+                        ("p90", percentile(values, 90)),
+                        ("p95", percentile(values, 95)),
+                        ("p99", percentile(values, 99)),
+                        ("max", values[-1] if values else None)
+                    )
+                }
+            }
+
+        print("\n" + "=" * 60)
+        print("📋 压测结果")
+        print("=" * 60)
+        print(f"总请求数: {report['total_requests']}, 耗时: {wall_time:.1f}s, "
+              f"吞吐量: {report['throughput_rps']:.2f} 请求/秒")
+        for name, stats in report["operations"].items():
+            latency = stats["latency_ms"]
+            print(f"{name}: {stats['requests']} 个请求, 成功 {stats['succeeded']}, "
+                  f"p50 {latency['p50']}ms, p95 {latency['p95']}ms, p99 {latency['p99']}ms, "
+                  f"状态码 {stats['status_codes']}")
+        if errors:
+            print(f"错误分布: {errors}")
+
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"📁 压测报告已保存: {output}")
+
+        return report
+
     def run_all_tests(self):
         """运行所有结果管理测试"""
         print("🚀 开始结果管理 API 测试")
@@ -229,10 +487,35 @@ def main():
 
     parser = argparse.ArgumentParser(description="结果管理 API 测试工具")
     parser.add_argument("--url", default="http://192.168.115.133:5000", help="API 服务器地址")
+    parser.add_argument("--load", action="store_true", help="压测模式")
+    parser.add_argument("--concurrency", type=int, default=4, help="压测并发数")
+    parser.add_argument("--duration", type=float, default=30, help="压测时长（秒）")
+    parser.add_argument("--requests", type=int, default=0, help="压测总请求数，0 表示只按时长结束")
+    parser.add_argument("--rate", type=float, default=0, help="开环模式的请求速率（请求/秒），0 为闭环模式")
+    parser.add_argument("--mix", default=DEFAULT_LOAD_MIX, help="请求比例，可选 single/multiple/list/download")
+    parser.add_argument("--category", default="loadtest", help="压测上传使用的类别")
+    parser.add_argument("--images", type=int, default=20, help="生成的测试图片数量")
+    parser.add_argument("--files-per-request", type=int, default=4, help="批量上传每次的文件数")
+    parser.add_argument("--output", help="压测报告 JSON 文件路径")
     args = parser.parse_args()
 
-    # 运行测试
     tester = ResultsAPITester(args.url)
+
+    if args.load:
+        report = tester.run_load_test(
+            concurrency=args.concurrency,
+            duration=args.duration,
+            total_requests=args.requests,
+            rate=args.rate,
+            mix=parse_mix(args.mix),
+            category=args.category,
+            image_count=args.images,
+            files_per_request=args.files_per_request,
+            output=args.output
+        )
+        return 0 if report["total_requests"] and not report["errors"] else 1
+
+    # 运行测试
     results = tester.run_all_tests()
 
     return 0 if all(results.values()) else 1
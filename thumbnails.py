@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+缩略图模块
+按需生成多种尺寸的 JPEG 缩略图并缓存到磁盘，源文件更新后自动重新生成
+"""
+
+import os
+import shutil
+import logging
+import threading
+from pathlib import Path
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# 缩略图尺寸：名称 -> 最长边像素
+THUMBNAIL_SIZES = {
+    "small": 160,
+    "medium": 480,
+    "large": 1024
+}
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_path(cache_dir: Path, kind: str, category: str, filename: str, size: str) -> Path:
+    """缩略图在缓存目录中的位置: <cache_dir>/<size>/<kind>/<category>/<文件名>.jpg"""
+    return Path(cache_dir) / size / kind / category / f"{filename}.jpg"
+
+
+def get_thumbnail(src: Path, dst: Path, size: str) -> bool:
+    """
+    获取缩略图，缓存不存在或已过期时生成
+    Args:
+        src: 原图路径
+        dst: 缩略图路径
+        size: THUMBNAIL_SIZES 中的尺寸名称
+    Returns:
+        True 表示命中缓存，False 表示本次新生成
+    """
+    max_dim = THUMBNAIL_SIZES[size]
+
+    try:
+        if dst.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+            return True
+    except FileNotFoundError:
+        pass
+
+    img = cv2.imread(str(src), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError(f"无法读取图像: {src}")
+
+    h, w = img.shape[:2]
+    scale = max_dim / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                         interpolation=cv2.INTER_AREA)
+
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    if not ok:
+        raise RuntimeError(f"缩略图编码失败: {src}")
+
+    # 先写临时文件再原子替换，并发请求同一缩略图时不会读到半个文件
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dst.with_name(f".{dst.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(buf.tobytes())
+    os.replace(tmp_path, dst)
+
+    logger.info("生成缩略图: %s (%sx%s -> 最长边 %s)", dst, w, h, max_dim)
+    return False
+
+
+def remove_category(cache_dir: Path, category: str):
+    """删除某个类别的所有缩略图缓存"""
+    for size in THUMBNAIL_SIZES:
+        for kind_dir in (Path(cache_dir) / size).glob("*"):
+            shutil.rmtree(kind_dir / category, ignore_errors=True)
+
+def remove_file(cache_dir: Path, kind: str, category: str, filename: str):
+    """删除某个文件所有尺寸的缩略图"""
+    for size in THUMBNAIL_SIZES:
+        try:
+            thumbnail_path(cache_dir, kind, category, filename, size).unlink()
+        except FileNotFoundError:
+            pass
\ No newline at end of file
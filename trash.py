@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+回收站模块
+清理时先把目录原子重命名到回收站，接口立即返回；真正的删除由后台线程逐步完成
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class TrashCollector:
+    """
+    后台删除器
+    回收站必须和被清理的目录在同一文件系统上，重命名才是原子操作；
+    任务由提交它的进程删除，任务状态写入 jobs_dir 后其他工作进程也能查询
+    """
+
+    def __init__(self, trash_dir: Path, batch_size: int = 1000, pause: float = 0.01, max_jobs: int = 100,
+                 on_done=None, jobs_dir: Path = None):
+        """
+        Args:
+            trash_dir: 回收站目录
+            batch_size: 每删除多少个文件让出一次 CPU
+            pause: 让出时间（秒）
+            max_jobs: 最多保留多少条任务记录
+            on_done: 每个任务删除完成后的回调，如回收孤立 blob
+            jobs_dir: 任务状态目录（每个任务一个 JSON 文件），None 表示只保存在本进程内存中
+        """
+        self.trash_dir = Path(trash_dir)
+        self.jobs_dir = Path(jobs_dir) if jobs_dir else None
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_jobs = max_jobs
+        self.on_done = on_done
+
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="trash-collector", daemon=True)
+                self._thread.start()
+
+    def submit(self, paths, label: str) -> dict:
+        """
+        把若干路径移入回收站并提交后台删除任务
+        Args:
+            paths: 要删除的文件或目录，不存在的路径会被忽略
+            label: 任务说明
+        Returns:
+            任务信息；没有任何路径被移动时 moved 为 0
+        """
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        job_id = uuid.uuid4().hex[:12]
+        moved = []
+
+        for i, path in enumerate(paths):
+            target = self.trash_dir / f"{job_id}_{i}_{Path(path).name}"
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue
+            moved.append(target)
+
+        job = {
+            "job_id": job_id,
+            "label": label,
+            "status": "pending" if moved else "done",
+            "moved": len(moved),
+            "deleted_files": 0,
+            "deleted_dirs": 0,
+            "deleted_bytes": 0,
+            "submitted_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "finished_at": None if moved else time.strftime('%Y-%m-%d %H:%M:%S'),
+            "error": None
+        }
+
+        if not moved:
+            return job
+
+        with self._lock:
+            self._jobs[job_id] = job
+            # 只保留最近的任务记录
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.pop(next(iter(self._jobs)))
+            self._save(job)
+        self._prune_saved()
+
+        self._queue.put((job_id, moved))
+        self._ensure_worker()
+
+        logger.info("清理任务 %s 已提交: %s, 移入回收站 %s 项", job_id, label, len(moved))
+        return dict(job)
+
+    def recover(self):
+        """把上次进程退出时没删完的回收站内容重新提交删除"""
+        if not self.trash_dir.exists():
+            return None
+        leftovers = list(self.trash_dir.iterdir())
+        if not leftovers:
+            return None
+
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            job = self._jobs[job_id] = {
+                "job_id": job_id,
+                "label": "回收站残留",
+                "status": "pending",
+                "moved": len(leftovers),
+                "deleted_files": 0,
+                "deleted_dirs": 0,
+                "deleted_bytes": 0,
+                "submitted_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+                "finished_at": None,
+                "error": None
+            }
+            self._save(job)
+        self._queue.put((job_id, leftovers))
+        self._ensure_worker()
+        return job_id
+
+    def _save(self, job: dict):
+        """任务状态写入 jobs_dir（调用方持有 self._lock）"""
+        if self.jobs_dir is None:
+            return
+        path = self.jobs_dir / f"{job['job_id']}.json"
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            self.jobs_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(job, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("保存清理任务状态失败: %s: %s", job["job_id"], e)
+
+    def _prune_saved(self):
+        """只保留最近 max_jobs 个任务状态文件"""
+        if self.jobs_dir is None or not self.jobs_dir.exists():
+            return
+        paths = sorted(self.jobs_dir.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for path in paths[:max(0, len(paths) - self.max_jobs)]:
+            path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _load(path: Path):
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def job(self, job_id: str):
+        """查询任务，本进程没有的任务从 jobs_dir 中读取（由其他工作进程提交）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if self.jobs_dir is None:
+            return None
+        return self._load(self.jobs_dir / f"{Path(job_id).name}.json")
+
+    def jobs(self) -> list:
+        """全部任务（包括其他工作进程提交的），按提交时间排列"""
+        if self.jobs_dir is None or not self.jobs_dir.exists():
+            with self._lock:
+                return [dict(job) for job in self._jobs.values()]
+        jobs = [job for job in map(self._load, self.jobs_dir.glob("*.json")) if job]
+        return sorted(jobs, key=lambda job: job["submitted_at"])
+
+    def _progress(self, job_id: str, **delta):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                for key, value in delta.items():
+                    job[key] += value
+                self._save(job)
+
+    def _set(self, job_id: str, **values):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(values)
+                self._save(job)
+
+    def _worker(self):
+        while True:
+            job_id, targets = self._queue.get()
+            self._set(job_id, status="running")
+            try:
+                for target in targets:
+                    self._remove_tree(job_id, target)
+                self._set(job_id, status="done", finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+                logger.info("清理任务 %s 完成", job_id)
+            except Exception as e:
+                self._set(job_id, status="failed", error=str(e),
+                          finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+                logger.error("清理任务 %s 失败: %s", job_id, e)
+            finally:
+                if self.on_done is not None:
+                    try:
+                        self.on_done()
+                    except Exception as e:
+                        logger.warning("清理任务完成回调失败: %s", e)
+                self._queue.task_done()
+
+    def _remove_tree(self, job_id: str, target: Path):
+        """自底向上删除，每删除 batch_size 个文件汇报一次进度并让出 CPU"""
+        if not target.is_dir() or target.is_symlink():
+            size = target.lstat().st_size
+            target.unlink()
+            self._progress(job_id, deleted_files=1, deleted_bytes=size)
+            return
+
+        files = 0
+        size = 0
+        for dirpath, dirnames, filenames in os.walk(target, topdown=False):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    size += os.lstat(path).st_size
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                files += 1
+                if files >= self.batch_size:
+                    self._progress(job_id, deleted_files=files, deleted_bytes=size)
+                    files = 0
+                    size = 0
+                    time.sleep(self.pause)
+            for name in dirnames:
+                try:
+                    os.rmdir(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                self._progress(job_id, deleted_dirs=1)
+
+        os.rmdir(target)
+        self._progress(job_id, deleted_files=files, deleted_bytes=size, deleted_dirs=1)
\ No newline at end of file
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+YOLOv8 API 客户端
+- 复用连接池中的长连接
+- 小图片自动合并到批量上传接口，大图片单独上传
+- 429/503 等可重试错误按 Retry-After 或指数退避自动重试
+- 可选在客户端把图片缩小到模型输入尺寸再上传，检测框自动换算回原图坐标
+
+示例:
+    from yolo_client import YoloClient
+
+    with YoloClient("http://localhost:5000", downscale=640) as client:
+        result = client.detect("images/a.jpg", category="food")
+        results = client.detect_many(["a.jpg", "b.jpg", "c.jpg"], category="food", concurrency=4)
+"""
+
+import time
+import random
+import asyncio
+import logging
+import email.utils
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+# 与服务端限制保持一致
+MAX_FILES_PER_REQUEST = 10
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+# 小于该大小的图片才合并到批量上传
+BATCH_FILE_BYTES = 1024 * 1024
+# 可重试的状态码
+RETRY_STATUS = {429, 502, 503, 504}
+# 非幂等请求（POST 上传）只在服务端明确没有处理时重试：429/503 是准入控制在推理前拒绝的；
+# 502/504 和读超时时服务端可能已经保存结果并完成推理，重试会产生重复结果
+UNSAFE_RETRY_STATUS = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class APIError(Exception):
+    """接口返回失败"""
+
+    def __init__(self, status: int, msg: str, data=None):
+        super().__init__(f"{status}: {msg}")
+        self.status = status
+        self.msg = msg
+        self.data = data
+
+
+def _connect_failed(error: requests.RequestException) -> bool:
+    """请求是否在建立连接时就失败了（请求没有发出，服务端不可能已经处理）"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _retry_after_seconds(value: str):
+    """解析 Retry-After，支持秒数和 HTTP 日期两种格式"""
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def downscale_image(data: bytes, max_side: int, quality: int = 90):
+    """
+    把图片缩小到长边不超过 max_side，重新编码为 JPEG
+    Returns:
+        (新内容, 换算信息)，换算信息为 {"scale_x", "scale_y", "width", "height"}，不需要缩小时为 None
+    """
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        raise ImportError("客户端缩放需要 opencv-python，请先执行 pip install opencv-python")
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("无法解码图片")
+
+    height, width = img.shape[:2]
+    scale = max(width, height) / max_side
+    if scale <= 1:
+        return data, None
+
+    resized = cv2.resize(img, (round(width / scale), round(height / scale)), interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("图片编码失败")
+    return encoded.tobytes(), {
+        "scale_x": width / resized.shape[1],
+        "scale_y": height / resized.shape[0],
+        "width": width,
+        "height": height
+    }
+
+
+def _rescale_result(result: dict, transform: dict):
+    """把缩小后图片上的检测框换算回原图坐标"""
+    if not transform or not result:
+        return result
+
+    def rescale(bbox):
+        x1, y1, x2, y2 = bbox
+        sx, sy = transform["scale_x"], transform["scale_y"]
+        return [x1 * sx, y1 * sy, x2 * sx, y2 * sy]
+
+    for detection in result.get("detections") or []:
+        if detection.get("bbox"):
+            detection["bbox"] = rescale(detection["bbox"])
+    best = result.get("best_detection")
+    if best and best.get("bbox"):
+        best["bbox"] = rescale(best["bbox"])
+    result.update({
+        "image_width": transform["width"],
+        "image_height": transform["height"],
+        "client_scale": round(transform["scale_x"], 4)
+    })
+    return result
+
+
+class YoloClient:
+    """YOLOv8 API 客户端，线程安全，可在多个线程中共享"""
+
+    def __init__(self, base_url: str = "http://localhost:5000",
+                 pool_size: int = 10,
+                 timeout: float = 120,
+                 max_retries: int = 3,
+                 backoff: float = 0.5,
+                 max_backoff: float = 30,
+                 downscale: int = None,
+                 jpeg_quality: int = 90):
+        """
+        Args:
+            base_url: 服务地址
+            pool_size: 连接池大小，应不小于并发数
+            timeout: 单个请求超时（秒）
+            max_retries: 最大重试次数
+            backoff: 指数退避的初始等待（秒）
+            max_backoff: 单次最长等待（秒）
+            downscale: 上传前把长边缩小到该尺寸（如 640），None 表示不缩放
+            jpeg_quality: 缩放后重新编码的 JPEG 质量
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.downscale = downscale
+        self.jpeg_quality = jpeg_quality
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        发送请求，可重试的错误按 Retry-After 或指数退避重试
+        非幂等请求只重试连接失败和 429/503，避免服务端已处理的上传被重复提交
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.base_url}{path}"
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_status = RETRY_STATUS if idempotent else UNSAFE_RETRY_STATUS
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries or not (idempotent or _connect_failed(e)):
+                    raise
+                wait = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning("请求失败，%.1fs 后重试: %s %s: %s", wait, method, path, e)
+                time.sleep(wait)
+                continue
+
+            if response.status_code not in retry_status or attempt >= self.max_retries:
+                return response
+
+            wait = _retry_after_seconds(response.headers.get("Retry-After"))
+            if wait is None:
+                wait = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.5)
+            wait = min(wait, self.max_backoff)
+            logger.warning("服务繁忙 (%s)，%.1fs 后重试: %s %s", response.status_code, wait, method, path)
+            time.sleep(wait)
+
+        return response
+
+    def _json(self, response: requests.Response):
+        try:
+            body = response.json()
+        except ValueError:
+            raise APIError(response.status_code, response.text[:200])
+        if response.status_code >= 400 or not body.get("ok"):
+            raise APIError(response.status_code, body.get("msg", ""), body.get("data"))
+        return body.get("data")
+
+    def _prepare(self, source, filename: str = None):
+        """
+        读取图片并按需缩小
+        Returns:
+            (文件名, 内容, 坐标换算信息)
+        """
+        if isinstance(source, (bytes, bytearray)):
+            data = bytes(source)
+            filename = filename or "image.jpg"
+        else:
+            path = Path(source)
+            data = path.read_bytes()
+            filename = filename or path.name
+
+        transform = None
+        if self.downscale:
+            data, transform = downscale_image(data, self.downscale, self.jpeg_quality)
+            if transform:
+                # 重新编码为 JPEG 后扩展名要与内容一致
+                filename = f"{Path(filename).stem}.jpg"
+        return filename, data, transform
+
+    def health(self) -> dict:
+        """服务状态"""
+        return self._json(self._request("GET", "/test"))
+
+    def detect(self, source, category: str = "default", filename: str = None) -> dict:
+        """
+        上传一张图片并返回推理结果
+        Args:
+            source: 图片路径或内容
+            category: 类别
+            filename: 上传使用的文件名，source 为内容时建议提供
+        Raises:
+            APIError: 接口返回失败
+        """
+        filename, data, transform = self._prepare(source, filename)
+        response = self._request("POST", f"/upload/{category}/single",
+                                 files={"file": (filename, data)})
+        return _rescale_result(self._json(response), transform)
+
+    def _upload_batch(self, prepared: list, category: str) -> list:
+        """把若干已准备好的图片通过批量接口上传，返回与输入顺序一致的结果列表"""
+        files = [("files", (filename, data)) for filename, data, _ in prepared]
+        try:
+            response = self._request("POST", f"/upload/{category}/multiple", files=files)
+            summary = self._json(response)
+        except (APIError, requests.RequestException) as e:
+            # 整个批量请求失败时，批内每张图片都记为失败，不影响其他批次
+            msg = e.msg if isinstance(e, APIError) else str(e)
+            return [{"ok": False, "msg": msg, "data": None} for _ in prepared]
+
+        results = []
+        for item, (_, _, transform) in zip(summary["results"], prepared):
+            results.append({
+                "ok": item["ok"],
+                "msg": item["msg"],
+                "data": _rescale_result(item["data"], transform) if item["ok"] else None
+            })
+        return results
+
+    @staticmethod
+    def _source_size(source) -> int:
+        """读取前的图片大小，用于分组；缩小只会让图片变小，按原始大小分组不会超出请求上限"""
+        if isinstance(source, (bytes, bytearray)):
+            return len(source)
+        try:
+            return Path(source).stat().st_size
+        except OSError:
+            # 读不到的文件在 worker 中准备时报错，这里只需要给它分一个组
+            return 0
+
+    def _plan(self, sizes: list) -> list:
+        """
+        按图片大小分组：小图片按数量和总大小上限合并为批量请求，大图片单独上传
+        Returns:
+            [(是否批量, [下标...])]
+        """
+        groups = []
+        batch, batch_bytes = [], 0
+        for i, size in enumerate(sizes):
+            if size > BATCH_FILE_BYTES:
+                groups.append((False, [i]))
+                continue
+            if len(batch) >= MAX_FILES_PER_REQUEST or batch_bytes + size > MAX_REQUEST_BYTES * 0.9:
+                groups.append((True, batch))
+                batch, batch_bytes = [], 0
+            batch.append(i)
+            batch_bytes += size
+        if batch:
+            groups.append((len(batch) > 1, batch))
+        return groups
+
+    def detect_many(self, sources: list, category: str = "default", concurrency: int = 4) -> list:
+        """
+        并发上传多张图片，小图片自动合并到批量接口
+        分组只看文件大小，读取和缩小在各个 worker 中进行，与上传重叠
+        Returns:
+            与输入顺序一致的 [{"ok", "msg", "data"}]，单张失败不影响其他图片
+        """
+        results = [None] * len(sources)
+
+        def prepare(indexes):
+            prepared = []
+            for i in indexes:
+                try:
+                    prepared.append((i, self._prepare(sources[i])))
+                except (OSError, ValueError, ImportError) as e:
+                    results[i] = {"ok": False, "msg": f"读取图片失败: {e}", "data": None}
+            return prepared
+
+        def run(group):
+            is_batch, indexes = group
+            prepared = prepare(indexes)
+            if is_batch and len(prepared) > 1:
+                batch = self._upload_batch([item for _, item in prepared], category)
+                for (i, _), result in zip(prepared, batch):
+                    results[i] = result
+                return
+            for i, (filename, data, transform) in prepared:
+                try:
+                    response = self._request("POST", f"/upload/{category}/single", files={"file": (filename, data)})
+                    results[i] = {"ok": True, "msg": "推理成功", "data": _rescale_result(self._json(response), transform)}
+                except (APIError, requests.RequestException) as e:
+                    results[i] = {"ok": False, "msg": str(e), "data": None}
+
+        sizes = [self._source_size(source) for source in sources]
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, self.pool_size))) as executor:
+            list(executor.map(run, self._plan(sizes)))
+        return results
+
+    def _async_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="yolo-client")
+        return self._executor
+
+    async def adetect(self, source, category: str = "default", filename: str = None) -> dict:
+        """detect 的异步版本，请求在线程池中执行，共享同一个连接池"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._async_executor(),
+                                          lambda: self.detect(source, category, filename))
+
+    async def adetect_many(self, sources: list, category: str = "default", concurrency: int = 4) -> list:
+        """detect_many 的异步版本"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._async_executor(),
+                                          lambda: self.detect_many(sources, category, concurrency))
+
+    def results(self, since: str = None) -> dict:
+        """结果列表，since 为上一次返回的 next_cursor 时只返回之后的新结果"""
+        params = {"since": since} if since else None
+        return self._json(self._request("GET", "/results", params=params))
+
+    def download(self, dest, category: str = None) -> Path:
+        """下载全部或某个类别的结果压缩包"""
+        path = f"/results/download/{category}" if category else "/results/download"
+        response = self._request("GET", path, stream=True)
+        if response.status_code != 200:
+            self._json(response)
+        dest = Path(dest)
+        with open(dest, "wb") as f:
+            for chunk in response.iter_content(64 * 1024):
+                f.write(chunk)
+        return dest
\ No newline at end of file